@@ -7,3 +7,22 @@ from .jbosscli import DataSource
 from .jbosscli import ServerGroup
 from .jbosscli import Deployment
 from .jbosscli import SystemProperty
+from .jbosscli import JsonCodec
+from .jbosscli import PreparedOperation
+from .jbosscli import Payload
+from .jbosscli import is_read_only
+from .jbosscli import get_codec
+from .jbosscli import available_codecs
+from .jbosscli import ThreadDump
+from .jbosscli import StackSummary
+from .jbosscli import capture_thread_dumps
+from .jbosscli import aggregate_stacks
+from .jbosscli import DataSourceHealth
+from .jbosscli import check_datasources
+from .jbosscli import SystemPropertyChanges
+from .jbosscli import AdaptiveLimiter
+from .jbosscli import ModelCache
+from .jbosscli import LogTail
+from .jbosscli import follow_logs
+from .jbosscli import TopologyIndex
+from .jbosscli import Profiler
@@ -0,0 +1,6 @@
+"""Allows running the command line as python -m jbosscli"""
+import sys
+
+from cli import main
+
+sys.exit(main())
@@ -0,0 +1,276 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Microbenchmarks for jbosscli
+
+Usage: python bench.py [benchmark] [arguments ...]
+
+Benchmarks that talk to a live controller take "host:port user:password" as arguments.
+"""
+
+import os
+import sys
+import json
+import time
+import timeit
+
+import jbosscli
+
+MEMORY_RESPONSE = {
+    "outcome": "success",
+    "result": {
+        "heap-memory-usage": {
+            "init": 1073741824, "used": 536870912, "committed": 1073741824, "max": 2147483648
+        },
+        "non-heap-memory-usage": {
+            "init": 24313856, "used": 134217728, "committed": 268435456, "max": 536870912
+        },
+        "object-name": "java.lang:type=Memory",
+        "object-pending-finalization-count": 0,
+        "verbose": False
+    }
+}
+
+MEMORY_COMMAND = {
+    "operation": "read-resource",
+    "include-runtime": "true",
+    "address": [
+        "host", "host1",
+        "server", "server-one",
+        "core-service", "platform-mbean", "type", "memory"
+    ]
+}
+
+def _report(label, seconds, number):
+    print "{0:<40} {1:>10.2f} us/op".format(label, seconds * 1e6 / number)
+
+def bench_codec(number=20000):
+    """Compares JSON codecs and precompiled operation payloads"""
+    response_text = json.dumps(MEMORY_RESPONSE)
+
+    for name in jbosscli.available_codecs():
+        codec = jbosscli.get_codec(name)
+        _report(
+            "{0} encode command".format(name),
+            timeit.timeit(lambda: codec.dumps(MEMORY_COMMAND), number=number),
+            number
+        )
+        _report(
+            "{0} decode response".format(name),
+            timeit.timeit(lambda: codec.loads(response_text), number=number),
+            number
+        )
+
+    prefix = ["host", "host1", "server", "server-one"]
+    _report(
+        "prepared memory payload",
+        timeit.timeit(lambda: jbosscli._MEMORY_STATUS.render(prefix), number=number),
+        number
+    )
+
+class _TransferCounter(object):
+    """Wraps requests.post to count response bytes per model loader"""
+    LOADERS = ["_fetch_controller_data", "_fetch_host_data", "_fetch_server_group_data"]
+
+    def __init__(self):
+        self.loader = None
+        self.sizes = {}
+        self._post = jbosscli.requests.post
+        self._loaders = dict((name, getattr(jbosscli.Jbosscli, name)) for name in self.LOADERS)
+
+    def __enter__(self):
+        jbosscli.requests.post = self.post
+        for name, loader in self._loaders.iteritems():
+            setattr(jbosscli.Jbosscli, name, self._wrap(name, loader))
+        return self
+
+    def __exit__(self, *args):
+        jbosscli.requests.post = self._post
+        for name, loader in self._loaders.iteritems():
+            setattr(jbosscli.Jbosscli, name, loader)
+
+    def _wrap(self, name, loader):
+        def wrapper(cli):
+            outer, self.loader = self.loader, name
+            try:
+                return loader(cli)
+            finally:
+                self.loader = outer
+        return wrapper
+
+    def post(self, *args, **kwargs):
+        resp = self._post(*args, **kwargs)
+        self.sizes[self.loader] = self.sizes.get(self.loader, 0) + len(resp.content)
+        return resp
+
+def bench_projection(controller, auth):
+    """Reports response bytes per model loader, full reads against projected reads"""
+    sizes = {}
+    for projection in (False, True):
+        with _TransferCounter() as counter:
+            jbosscli.Jbosscli(controller, auth, projection=projection)
+        sizes[projection] = counter.sizes
+
+    for loader in _TransferCounter.LOADERS:
+        full = sizes[False].get(loader, 0)
+        projected = sizes[True].get(loader, 0)
+        print "{0:<28} {1:>10} B full {2:>10} B projected {3:>10} B saved".format(
+            loader, full, projected, full - projected
+        )
+
+def bench_replay(recording, latency_scale="0", repeat="5"):
+    """Times model loading against a recorded domain, see replay.py"""
+    import replay
+
+    session = replay.ReplaySession(recording, float(latency_scale), any_controller=True)
+    timings = []
+    for _ in range(int(repeat)):
+        start = time.time()
+        jbosscli.Jbosscli("recorded", "replay:replay", session=session)
+        timings.append(time.time() - start)
+
+    print "{0:<40} {1:>10.2f} ms best {2:>10.2f} ms worst".format(
+        "model load", min(timings) * 1e3, max(timings) * 1e3
+    )
+
+class ReplayFactory(object):
+    """Picklable cli factory answering every controller from the same recording"""
+    _sessions = {}
+
+    def __init__(self, recording, latency_scale=0):
+        self.recording = recording
+        self.latency_scale = latency_scale
+
+    def __call__(self, controller, auth):
+        import replay
+
+        key = (self.recording, self.latency_scale)
+        session = self._sessions.get(key)
+        if session is None:
+            session = self._sessions[key] = replay.ReplaySession(
+                self.recording, self.latency_scale, any_controller=True
+            )
+        return jbosscli.Jbosscli(controller, auth, session=session)
+
+def bench_sweep(recording, controllers="200", max_processes=None, latency_scale="1",
+                threads="16"):
+    """
+    Times a sharded sweep of a recorded domain by number of processes, replaying
+    the recorded latencies (times latency_scale) so I/O concurrency counts
+    """
+    import multiprocessing
+    import sweep
+
+    fleet = [("controller{0}".format(i), "replay:replay") for i in range(int(controllers))]
+    factory = ReplayFactory(recording, float(latency_scale))
+    max_processes = int(max_processes or multiprocessing.cpu_count())
+
+    configurations = []
+    for pool_threads in (1, int(threads)):
+        for processes in (1, max_processes):
+            if (processes, pool_threads) not in configurations:
+                configurations.append((processes, pool_threads))
+
+    for processes, pool_threads in configurations:
+        start = time.time()
+        results, errors = sweep.sweep(
+            fleet, processes=processes, cli_factory=factory, threads=pool_threads
+        )
+        elapsed = time.time() - start
+        print "{0:>3} processes {1:>3} threads {2:>8.2f} s {3:>8.1f} controllers/s {4} errors".format(
+            processes, pool_threads, elapsed, len(results) / elapsed, len(errors)
+        )
+
+def _best_of(argv, repeat):
+    import subprocess
+
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        subprocess.check_call(
+            argv,
+            stdout=open(os.devnull, "w"),
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        timings.append(time.time() - start)
+    return min(timings)
+
+def bench_startup(repeat="5"):
+    """Times interpreter start, import and first result of the command line"""
+    import threading
+    import stub
+
+    server = stub.StubController()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    python = sys.executable
+    eager = "import jbosscli; print jbosscli.Jbosscli('{0}', 'a:b').product_version".format(
+        server.controller
+    )
+    runs = [
+        ("interpreter", [python, "-c", "pass"]),
+        ("import jbosscli", [python, "-c", "import jbosscli"]),
+        ("cli.py --help", [python, os.path.join(here, "cli.py"), "--help"]),
+        ("cli.py info (first result)",
+         [python, os.path.join(here, "cli.py"), "-c", server.controller, "-u", "a:b", "info"]),
+        ("Jbosscli model load (first result)", [python, "-c", eager])
+    ]
+
+    try:
+        for label, argv in runs:
+            _report_ms(label, _best_of(argv, int(repeat)))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def bench_profile(controller=None, auth="a:b", **options):
+    """Profiles a model load, against the stub controller if none is given"""
+    import threading
+    import stub
+
+    server = None
+    if controller is None:
+        server = stub.StubController()
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        controller = server.controller
+
+    try:
+        profiler = jbosscli.Profiler()
+        jbosscli.Jbosscli(controller, auth, profiler=profiler, **options)
+        print profiler.report()
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+def _report_ms(label, seconds):
+    print "{0:<40} {1:>10.2f} ms".format(label, seconds * 1e3)
+
+BENCHMARKS = {
+    "codec": bench_codec,
+    "projection": bench_projection,
+    "replay": bench_replay,
+    "sweep": bench_sweep,
+    "startup": bench_startup,
+    "profile": bench_profile
+}
+
+OFFLINE_BENCHMARKS = ["codec", "startup"]
+
+def main(argv):
+    if len(argv) > 1:
+        print "-- {0}".format(argv[1])
+        BENCHMARKS[argv[1]](*argv[2:])
+        return
+
+    for name in OFFLINE_BENCHMARKS:
+        print "-- {0}".format(name)
+        BENCHMARKS[name]()
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,131 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+jbosscli command line.
+
+Runs raw management operations and common queries without loading the whole
+controller model. The controller and credentials default to the
+JBOSSCLI_CONTROLLER and JBOSSCLI_AUTH environment variables.
+"""
+
+import os
+import sys
+import json
+import argparse
+
+def _parse_where(conditions):
+    where = {}
+    for condition in conditions or []:
+        key, _, value = condition.partition("=")
+        if value.lower() in ("true", "false"):
+            value = value.lower() == "true"
+        where[key] = value
+    return where
+
+def _connect(args):
+    # Deferred so --help and argument errors never pay for the client imports
+    from jbosscli import Jbosscli
+    return Jbosscli(args.controller, args.auth, timeout=args.timeout, fetch_model=False)
+
+def _rows(matches, columns, address_keys=()):
+    rows = []
+    for address, data in matches:
+        parts = dict(item for element in address for item in element.items())
+        rows.append([parts.get(key) for key in address_keys] + [data.get(c) for c in columns])
+    return rows
+
+def raw(cli, args):
+    """Runs a management operation given as JSON, - reads it from stdin"""
+    operation = sys.stdin.read() if args.operation == "-" else args.operation
+    return cli.invoke_cli(json.loads(operation))
+
+def info(cli, args):
+    """Controller name, product, version and launch type"""
+    from jbosscli import PROJECTIONS
+    data = cli.read_projection(PROJECTIONS["controller"])
+    return [[key, data.get(key)] for key in PROJECTIONS["controller"] if key in data]
+
+def hosts(cli, args):
+    """Hosts of the domain and their state"""
+    return _rows(
+        cli.query(["host", "*"], _parse_where(args.where), ["name", "host-state", "master"]),
+        ["name", "host-state", "master"]
+    )
+
+def instances(cli, args):
+    """Server instances of the domain: host, name, group and status"""
+    return [
+        [i.host.name, i.name, i.server_group_name, i.status]
+        for i in cli.find_instances(_parse_where(args.where))
+    ]
+
+def deployments(cli, args):
+    """Deployments, per server group in domain mode"""
+    return [
+        ([d.server_group.name] if d.server_group is not None else []) +
+        [d.name, d.runtime_name, d.enabled]
+        for d in cli.find_deployments(_parse_where(args.where))
+    ]
+
+def groups(cli, args):
+    """Server groups of the domain"""
+    from jbosscli import PROJECTIONS
+    columns = PROJECTIONS["server-group"][1:]
+    return _rows(
+        cli.query(["server-group", "*"], _parse_where(args.where), columns),
+        columns,
+        ["server-group"]
+    )
+
+COMMANDS = [raw, info, hosts, instances, deployments, groups]
+
+def _parser():
+    parser = argparse.ArgumentParser(prog="jbosscli", description=__doc__.strip().split("\n")[0])
+    parser.add_argument(
+        "-c", "--controller",
+        default=os.environ.get("JBOSSCLI_CONTROLLER", "localhost:9990"),
+        help="host:port of the controller"
+    )
+    parser.add_argument(
+        "-u", "--auth",
+        default=os.environ.get("JBOSSCLI_AUTH", ":"),
+        help="user:password"
+    )
+    parser.add_argument("-t", "--timeout", type=float, help="request timeout in seconds")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+
+    subparsers = parser.add_subparsers(dest="command")
+    for command in COMMANDS:
+        subparser = subparsers.add_parser(command.__name__, help=command.__doc__)
+        subparser.set_defaults(func=command)
+        if command is raw:
+            subparser.add_argument("operation")
+        elif command is not info:
+            subparser.add_argument(
+                "-w", "--where", action="append", metavar="ATTRIBUTE=VALUE",
+                help="only resources with this attribute value"
+            )
+
+    return parser
+
+def _print(result, as_json):
+    if as_json or not isinstance(result, list):
+        print json.dumps(result, indent=2, sort_keys=True)
+        return
+    for row in result:
+        print u"\t".join(u"" if value is None else unicode(value) for value in row).encode("utf-8")
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+    from jbosscli import CliError, ServerError
+
+    try:
+        _print(args.func(_connect(args), args), args.json or args.func is raw)
+    except (CliError, ServerError) as ex:
+        sys.stderr.write("jbosscli: {0}\n".format(ex.msg))
+        return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
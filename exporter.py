@@ -0,0 +1,275 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Metrics exporter for a Jboss controller.
+
+Collects JVM memory and datasource pool statistics of every running instance
+in the background, with batched composite reads, and serves the latest values
+in the Prometheus text exposition format on GET /metrics.
+
+Usage: python exporter.py controller:port user:password [listen_port] [interval]
+"""
+
+import sys
+import time
+import threading
+import BaseHTTPServer
+import SocketServer
+
+from jbosscli import Jbosscli
+from jbosscli import CliError
+from jbosscli import ServerError
+from jbosscli import DataSource
+
+MEMORY_ADDRESS = ["core-service", "platform-mbean", "type", "memory"]
+DATASOURCES_ADDRESS = ["subsystem", "datasources"]
+
+# (metric, help, memory area, usage field)
+MEMORY_METRICS = [
+    ("jbosscli_heap_used_bytes", "Used heap memory", "heap-memory-usage", "used"),
+    ("jbosscli_heap_committed_bytes", "Committed heap memory", "heap-memory-usage", "committed"),
+    ("jbosscli_heap_max_bytes", "Maximum heap memory", "heap-memory-usage", "max"),
+    ("jbosscli_nonheap_used_bytes", "Used non-heap memory", "non-heap-memory-usage", "used"),
+    ("jbosscli_nonheap_committed_bytes", "Committed non-heap memory",
+     "non-heap-memory-usage", "committed")
+]
+
+# (metric, help, DataSource attribute)
+DATASOURCE_METRICS = [
+    ("jbosscli_datasource_active_connections", "Active connections", "active_connections"),
+    ("jbosscli_datasource_available_connections", "Available connections",
+     "available_connections"),
+    ("jbosscli_datasource_in_use_connections", "Connections in use", "in_use_connections"),
+    ("jbosscli_datasource_max_used_connections", "Most connections used at once",
+     "max_used_connections"),
+    ("jbosscli_datasource_max_wait_time", "Longest wait for a connection, in ms",
+     "max_wait_time"),
+    ("jbosscli_datasource_max_pool_size", "Maximum pool size", "max_pool_size")
+]
+
+def _escape(value):
+    return unicode(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return u"{" + u",".join(
+        u'{0}="{1}"'.format(key, _escape(value)) for key, value in sorted(labels.items())
+    ) + u"}"
+
+class MetricsCollector(object):
+    """
+    Periodically collects the metrics of the running instances of cli.
+    Server status is re-read every status_every collections, so started and
+    stopped servers are picked up. The rendered exposition text of the last
+    collection is kept in latest.
+    """
+    def __init__(self, cli, interval=15, batch_size=50, status_every=4):
+        self.cli = cli
+        self.interval = interval
+        self.batch_size = batch_size
+        self.status_every = status_every
+        self.collections = 0
+        self.latest = ""
+        self._stop = threading.Event()
+        self._thread = None
+
+    def targets(self):
+        """Returns (labels, address prefix) for each server to collect from"""
+        if not self.cli.domain:
+            return [({}, [])]
+
+        return [
+            ({"host": host.name, "server": instance.name},
+             ["host", host.name, "server", instance.name])
+            for host in self.cli.hosts
+            for instance in host.instances
+            if instance.running()
+        ]
+
+    def collect(self):
+        """Collects all metrics once, updating latest"""
+        start = time.time()
+        samples = dict((name, []) for name, _, _, _ in MEMORY_METRICS)
+        samples.update((name, []) for name, _, _ in DATASOURCE_METRICS)
+        samples["jbosscli_up"] = []
+
+        if self.collections and self.status_every and self.collections % self.status_every == 0:
+            self._refresh_status()
+        self.collections += 1
+
+        targets = self.targets()
+        steps = []
+        for _, prefix in targets:
+            steps.append({
+                "operation": "read-resource",
+                "include-runtime": True,
+                "address": prefix + MEMORY_ADDRESS
+            })
+            steps.append({
+                "operation": "read-children-resources",
+                "child-type": "data-source",
+                "include-runtime": True,
+                "recursive": True,
+                "address": prefix + DATASOURCES_ADDRESS
+            })
+
+        results = []
+        for offset in range(0, len(steps), self.batch_size):
+            results.extend(self._read_batch(steps[offset:offset + self.batch_size]))
+
+        for index, (labels, _) in enumerate(targets):
+            memory, datasources = results[2 * index], results[2 * index + 1]
+            samples["jbosscli_up"].append((labels, 0 if memory is None else 1))
+            self._memory_samples(samples, labels, memory)
+            self._datasource_samples(samples, labels, datasources)
+
+        self.latest = self.render(samples, time.time() - start)
+        return self.latest
+
+    def _refresh_status(self):
+        try:
+            self.cli.refresh_status()
+        except (CliError, ServerError):
+            # collect from the servers known so far, retry on the next round
+            pass
+
+    def _read_batch(self, steps):
+        """Returns the result of each step, None for the failed ones"""
+        try:
+            return self.cli.composite(steps)
+        except CliError as ex:
+            outcomes = ex.raw.get("result") if isinstance(ex.raw, dict) else None
+        except ServerError:
+            return [None] * len(steps)
+
+        if not isinstance(outcomes, dict):
+            outcomes = {}
+
+        # one failed step rolls the whole composite back and cancels the
+        # steps after it, so only a step failing on its own marks a server down
+        results = []
+        for i, step in enumerate(steps):
+            outcome = outcomes.get("step-{0}".format(i + 1)) or {}
+            if outcome.get("outcome") == "success":
+                results.append(outcome.get("result"))
+            else:
+                results.append(self._read_step(step))
+        return results
+
+    def _read_step(self, step):
+        try:
+            return self.cli.invoke_cli(step)
+        except (CliError, ServerError):
+            return None
+
+    def _memory_samples(self, samples, labels, memory):
+        if not memory:
+            return
+        for name, _, area, field in MEMORY_METRICS:
+            value = (memory.get(area) or {}).get(field)
+            if value is not None:
+                samples[name].append((labels, value))
+
+    def _datasource_samples(self, samples, labels, datasources):
+        if not datasources:
+            return
+        for ds_name, ds_data in datasources.iteritems():
+            ds_data["name"] = ds_name
+            datasource = DataSource(ds_data)
+            ds_labels = dict(labels, datasource=ds_name)
+            for name, _, attribute in DATASOURCE_METRICS:
+                value = getattr(datasource, attribute, None)
+                if value is not None:
+                    samples[name].append((ds_labels, value))
+
+    def render(self, samples, duration):
+        """Renders samples in the text exposition format"""
+        helps = [(name, text) for name, text, _, _ in MEMORY_METRICS]
+        helps.extend((name, text) for name, text, _ in DATASOURCE_METRICS)
+        helps.append(("jbosscli_up", "1 if the server answered the last collection"))
+
+        lines = []
+        for name, text in helps:
+            lines.append("# HELP {0} {1}".format(name, text))
+            lines.append("# TYPE {0} gauge".format(name))
+            for labels, value in samples[name]:
+                lines.append(u"{0}{1} {2}".format(name, _labels(labels), value))
+
+        lines.append("# HELP jbosscli_collection_seconds Duration of the last collection")
+        lines.append("# TYPE jbosscli_collection_seconds gauge")
+        lines.append("jbosscli_collection_seconds {0:.6f}".format(duration))
+        lines.append("# HELP jbosscli_collection_timestamp_seconds End of the last collection")
+        lines.append("# TYPE jbosscli_collection_timestamp_seconds gauge")
+        lines.append("jbosscli_collection_timestamp_seconds {0:.3f}".format(time.time()))
+
+        return u"\n".join(lines).encode("utf-8") + "\n"
+
+    def start(self):
+        """Collects every interval seconds in a background thread"""
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background collection"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.collect()
+            except Exception:
+                # keep serving the last good collection
+                pass
+            self._stop.wait(self.interval)
+
+class MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves the latest collection on GET /metrics"""
+    def do_GET(self):
+        if self.path.split("?")[0].rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+
+        body = self.server.collector.latest
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class MetricsServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Threaded HTTP server exposing a MetricsCollector"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, collector):
+        BaseHTTPServer.HTTPServer.__init__(self, address, MetricsRequestHandler)
+        self.collector = collector
+
+def main(argv):
+    if len(argv) < 3:
+        print __doc__
+        return 1
+
+    port = int(argv[3]) if len(argv) > 3 else 9992
+    interval = float(argv[4]) if len(argv) > 4 else 15
+
+    collector = MetricsCollector(Jbosscli(argv[1], argv[2]), interval=interval)
+    collector.start()
+
+    server = MetricsServer(("", port), collector)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        collector.stop()
+        server.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -3,34 +3,640 @@
 Jbosscli
 """
 
+import os
+import copy
 import json
+import time
 import types
-import requests
+import errno
+import Queue
+import hashlib
+import tempfile
+import threading
+import functools
+import importlib
+import contextlib
+
+class _LazyModule(object):
+    """Imports a module on first use, so importing jbosscli stays cheap"""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+requests = _LazyModule("requests")
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+class JsonCodec(object):
+    """Encodes commands and decodes responses using the standard library json"""
+    name = "json"
+
+    def dumps(self, obj):
+        """Serializes obj to a JSON string"""
+        return json.dumps(obj)
+
+    def loads(self, text):
+        """Parses a JSON string"""
+        return json.loads(text)
+
+    def decode_response(self, req):
+        """Decodes the body of a management response"""
+        return req.json()
+
+class SimpleJsonCodec(JsonCodec):
+    """Codec backed by simplejson, if installed"""
+    name = "simplejson"
+
+    def dumps(self, obj):
+        return simplejson.dumps(obj)
+
+    def loads(self, text):
+        return simplejson.loads(text)
+
+    def decode_response(self, req):
+        return self.loads(req.content)
+
+class UltraJsonCodec(JsonCodec):
+    """Codec backed by ujson, if installed"""
+    name = "ujson"
+
+    def dumps(self, obj):
+        return ujson.dumps(obj)
+
+    def loads(self, text):
+        return ujson.loads(text)
+
+    def decode_response(self, req):
+        return self.loads(req.content)
+
+# Ordered from fastest to slowest
+_CODECS = [
+    (UltraJsonCodec, lambda: ujson is not None),
+    (SimpleJsonCodec, lambda: simplejson is not None),
+    (JsonCodec, lambda: True)
+]
+
+def available_codecs():
+    """Returns the names of the codecs usable in this environment, fastest first"""
+    return [codec.name for codec, available in _CODECS if available()]
+
+def get_codec(codec=None):
+    """
+    Returns a codec instance.
+    codec may be None (standard library json), "fastest", a codec name or a codec instance.
+    """
+    if codec is None:
+        return JsonCodec()
+    if not isinstance(codec, basestring):
+        return codec
+
+    for codec_class, available in _CODECS:
+        if codec in ("fastest", codec_class.name) and available():
+            return codec_class()
+
+    raise ValueError("JSON codec not available: {0}".format(codec))
+
+class _Flight(object):
+    """An in-flight request whose outcome is shared by coalesced callers"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        """Blocks until the leading request finishes, returning or raising its outcome"""
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+def is_read_only(command):
+    """True if command does not change the server, so it can be coalesced or cached"""
+    if isinstance(command, types.StringType):
+        return getattr(command, "read_only", False)
+
+    operation = command.get("operation", "")
+    if operation == "composite":
+        return all(is_read_only(step) for step in command.get("steps", []))
+
+    return operation.startswith("read-") or operation == "query"
+
+_encode_string = json.encoder.encode_basestring_ascii
+
+class Payload(str):
+    """A serialized command that knows whether it is read only and its address"""
+    read_only = False
+    address = ()
+
+class PreparedOperation(object):
+    """
+    A command serialized once, ready to be sent as is.
+    Only the address is substituted on render.
+    """
+    _MARKER = "__jbosscli_address__"
+
+    def __init__(self, command):
+        self.read_only = is_read_only(command)
+        template = dict(command)
+        self.address = list(template.pop("address", []))
+        template["address"] = self._MARKER
+
+        encoded = json.dumps(template)
+        head, tail = encoded.split(json.dumps(self._MARKER))
+        self._head = head + "["
+        self._address = ", ".join(_encode_string(part) for part in self.address)
+        self._tail = "]" + tail
+
+    def render(self, address_prefix=None):
+        """Returns the JSON payload with address_prefix prepended to the address"""
+        if not address_prefix:
+            payload = Payload(self._head + self._address + self._tail)
+        else:
+            parts = [_encode_string(part) for part in address_prefix]
+            if self._address:
+                parts.append(self._address)
+            payload = Payload(self._head + ", ".join(parts) + self._tail)
+
+        payload.read_only = self.read_only
+        payload.address = list(address_prefix or []) + self.address
+        return payload
+
+_MEMORY_STATUS = PreparedOperation({
+    "operation": "read-resource",
+    "include-runtime": "true",
+    "address": [
+        "core-service",
+        "platform-mbean",
+        "type",
+        "memory"
+    ]
+})
+
+# Attributes consumed by the model loaders, per resource type
+PROJECTIONS = {
+    "controller": [
+        "name", "product-name", "product-version", "release-codename",
+        "release-version", "launch-type", "local-host-name"
+    ],
+    "system-property": ["value", "boot-time"],
+    "deployment": ["name", "runtime-name", "enabled"],
+    "host": [
+        "name", "product-name", "product-version", "release-codename",
+        "release-version", "master", "host-state"
+    ],
+    "server-config": ["name", "group", "status"],
+    "server-group": [
+        "name", "profile", "socket-binding-group", "socket-binding-port-offset"
+    ]
+}
+
+def _projection_step(address):
+    return {
+        "operation": "read-resource",
+        "attributes-only": True,
+        "include-runtime": True,
+        "address": address
+    }
+
+def _select(result, attributes):
+    """Keeps only attributes of a read-resource result, wildcard results included"""
+    if isinstance(result, list):
+        return [
+            (item["address"], _select(item["result"], attributes))
+            for item in result if item.get("outcome") == "success"
+        ]
+
+    return dict((k, v) for k, v in result.iteritems() if k in attributes)
+
+def _matches(data, where):
+    """Client side counterpart of the query operation where clause"""
+    if not where:
+        return True
+    return all(
+        unicode(data.get(key)).lower() == unicode(value).lower()
+        for key, value in where.iteritems()
+    )
+
+def _is_unknown_operation(error):
+    # WFLYCTL0031 / JBAS014884: No operation named 'query' exists at address
+    return "No operation named" in unicode(error.msg)
+
+def _is_missing_resource(error):
+    # WFLYCTL0216 / JBAS014807: Management resource '[...]' not found
+    message = unicode(error.msg)
+    return "WFLYCTL0216" in message or "JBAS014807" in message
+
+def _address_value(address, key):
+    """Returns the value for key in an address like [{"host": "h1"}, {"server": "s1"}]"""
+    for element in address:
+        if key in element:
+            return element[key]
+    return None
+
+def _host_of(command):
+    """Returns the host a command is addressed to, if any"""
+    if isinstance(command, types.StringType):
+        address = getattr(command, "address", ())
+    else:
+        address = command.get("address") or ()
+
+    if not address:
+        return None
+    if isinstance(address[0], dict):
+        return address[0].get("host")
+    if address[0] == "host" and len(address) > 1:
+        return address[1]
+    return None
+
+class AdaptiveLimiter(object):
+    """
+    Limits requests in flight, adapting the limit to the observed latency.
+    The limit grows by about one per limit successful requests and is multiplied
+    by backoff on errors or when latency exceeds tolerance times the baseline,
+    staying between floor and ceiling. With per_host, requests addressed to a
+    host are also limited by a limiter of their own for that host.
+    """
+    def __init__(self, floor=1, ceiling=32, initial=None, tolerance=2.0, backoff=0.5,
+                 per_host=True):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.per_host = per_host
+        self.limit = float(initial if initial is not None else floor)
+        self.in_flight = 0
+        self.baseline = None
+        self._decreased_at = 0
+        self._condition = threading.Condition()
+        self._hosts = {}
+
+    def for_host(self, host):
+        """Returns the limiter for host, None if hosts are not limited apart"""
+        if not self.per_host or host is None:
+            return None
+
+        with self._condition:
+            limiter = self._hosts.get(host)
+            if limiter is None:
+                limiter = self._hosts[host] = AdaptiveLimiter(
+                    self.floor, self.ceiling, tolerance=self.tolerance,
+                    backoff=self.backoff, per_host=False
+                )
+            return limiter
+
+    def acquire(self):
+        """Blocks until a request may be sent"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, failed=False):
+        """Accounts for a finished request and adapts the limit"""
+        with self._condition:
+            self.in_flight -= 1
+
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                self.baseline += (latency - self.baseline) * 0.05
+
+            now = time.time()
+            if failed or latency > self.baseline * self.tolerance:
+                # back off at most once per baseline latency
+                if now - self._decreased_at >= self.baseline:
+                    self.limit = max(self.floor, self.limit * self.backoff)
+                    self._decreased_at = now
+            else:
+                self.limit = min(self.ceiling, self.limit + 1.0 / self.limit)
+
+            self._condition.notify_all()
+
+    def __repr__(self):
+        return "AdaptiveLimiter(limit={0:.1f}, in_flight={1}, hosts={2})".format(
+            self.limit, self.in_flight, len(self._hosts)
+        )
+
+class _NoPhase(object):
+    """Stands in for a profiler phase when profiling is off"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+_NO_PHASE = _NoPhase()
+
+def _profiled(name):
+    """Runs a Jbosscli method as a profiler phase, when the instance has a profiler"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self._phase(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+_PAGE_SIZE = resource.getpagesize() if resource is not None else 4096
+
+def _cpu_time():
+    """User and system CPU seconds used by the process"""
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+    return time.clock()
+
+def _memory_usage():
+    """
+    Bytes traced by tracemalloc if it is tracing, else the current resident
+    set size, else the peak resident set size where /proc is not available
+    """
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (IOError, IndexError, ValueError):
+        pass
+    if resource is not None:
+        # kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return 0
+
+class PhaseStats(object):
+    """Accumulated measures of a profiler phase"""
+    def __init__(self, path):
+        self.path = path
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.memory = 0
+        self.child_wall = 0.0
+
+    @property
+    def self_wall(self):
+        """Wall time not spent in nested phases"""
+        return self.wall - self.child_wall
+
+class Profiler(object):
+    """
+    Records wall time, CPU time and memory growth of nested phases, such as
+    the model fetches, network waits, JSON decoding and object building of
+    Jbosscli. Memory is the growth of the traced allocation when tracemalloc
+    is tracing, otherwise of the resident set size. Freed memory a phase
+    returns to the system counts as negative growth.
+    """
+    def __init__(self):
+        self.phases = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Measures the enclosed block as phase name, nested in the current phase"""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(name)
+        path = "/".join(stack)
+
+        wall, cpu, memory = time.time(), _cpu_time(), _memory_usage()
+        try:
+            yield
+        finally:
+            wall = time.time() - wall
+            cpu = _cpu_time() - cpu
+            memory = _memory_usage() - memory
+            stack.pop()
+
+            with self._lock:
+                stats = self.phases.get(path)
+                if stats is None:
+                    stats = self.phases[path] = PhaseStats(path)
+                stats.calls += 1
+                stats.wall += wall
+                stats.cpu += cpu
+                stats.memory += memory
+                if stack:
+                    parent = self.phases.get("/".join(stack))
+                    if parent is None:
+                        parent = self.phases["/".join(stack)] = PhaseStats("/".join(stack))
+                    parent.child_wall += wall
+
+    def report(self):
+        """Returns a table of the phases in tree order"""
+        lines = ["{0:<60} {1:>6} {2:>10} {3:>10} {4:>10} {5:>12}".format(
+            "phase", "calls", "wall ms", "self ms", "cpu ms", "memory KB"
+        )]
+        for path in sorted(self.phases):
+            stats = self.phases[path]
+            lines.append("{0:<60} {1:>6} {2:>10.2f} {3:>10.2f} {4:>10.2f} {5:>12.1f}".format(
+                "  " * path.count("/") + path.rsplit("/", 1)[-1],
+                stats.calls,
+                stats.wall * 1e3,
+                stats.self_wall * 1e3,
+                stats.cpu * 1e3,
+                stats.memory / 1024.0
+            ))
+        return "\n".join(lines)
 
 class Jbosscli(object):
     """Represents a Jboss controller, Standalone and domain modes are supported"""
-    def __init__(self, controller, auth):
+    def __init__(self, controller, auth, codec=None, projection=False, compress=True,
+                 coalesce=True, session=None, timeout=None, page_size=None, limiter=None,
+                 model_cache=None, fetch_model=True, profiler=None):
         self.controller = controller
+        self.profiler = profiler
+        self.model_cache = model_cache
+        self.limiter = limiter
+        self.page_size = page_size
+        self.timeout = timeout
         self.credentials = auth.split(":")
+        self.session = session
+        self._auth = requests.auth.HTTPDigestAuth(self.credentials[0], self.credentials[1])
+        self.codec = get_codec(codec)
+        self.projection = projection
+        self.compress = compress
+        self.coalesce = coalesce
+        self.coalesced_calls = 0
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._generation = 0
+        self._query_supported = True
+        self._local = threading.local()
+        self._topology = None
+        self._launch_type = None
         self.data = {}
-        self._fetch_controller_data()
 
-    def invoke_cli(self, command):
-        """Calls Jboss management interface"""
+        if fetch_model:
+            self.refresh()
+
+    @_profiled("refresh")
+    def refresh(self):
+        """(Re)loads the controller model, from the model cache if there is one"""
+        if self.model_cache is not None:
+            self.model_cache.load(self)
+        else:
+            self._fetch_controller_data()
+
+    def invoke_cli(self, command, timeout=None):
+        """
+        Calls Jboss management interface, timeout in seconds overrides the default one.
+        Concurrent identical read operations share a single request and its result,
+        unless a write completed since that request was sent.
+        """
+        data = command if isinstance(command, types.StringType) else self.codec.dumps(command)
+        timeout = self.timeout if timeout is None else timeout
+
+        if self._snapshot is not None:
+            return self._snapshot_invoke(command, data, timeout)
+
+        if not is_read_only(command):
+            return self._write(command, data, timeout)
+
+        if not self.coalesce:
+            return self._send(command, data, timeout)
+
+        with self._inflight_lock:
+            key = (self._generation, data)
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self.coalesced_calls += 1
+
+        if not leader:
+            return flight.wait()
+
+        try:
+            flight.result = self._send(command, data, timeout)
+        except Exception as ex:
+            flight.error = ex
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+            flight.done.set()
+
+        return flight.result
+
+    def _write(self, command, data, timeout, post=None):
+        try:
+            return self._send(command, data, timeout, post)
+        finally:
+            # reads sent from now on must not join reads that may predate the write
+            with self._inflight_lock:
+                self._generation += 1
+
+    @property
+    def _snapshot(self):
+        # Per thread, so only the thread loading the model records or replays
+        return getattr(self._local, "snapshot", None)
+
+    @_snapshot.setter
+    def _snapshot(self, snapshot):
+        self._local.snapshot = snapshot
+
+    def _snapshot_invoke(self, command, data, timeout):
+        """Records or serves the responses of a model load, see ModelCache"""
+        recording, responses = self._snapshot
+        # Keyed independently of the codec, which may format payloads differently
+        key = data if isinstance(command, types.StringType) else json.dumps(command, sort_keys=True)
+        if not recording:
+            if key not in responses:
+                raise _SnapshotMiss(key)
+            return responses[key]
+
+        result = self._send(command, data, timeout)
+        responses[key] = result
+        return result
+
+    def invoke_raw(self, command, timeout=None):
+        """
+        Calls Jboss management interface and returns its full response body,
+        response-headers and failed outcomes included. Not coalesced.
+        """
+        data = command if isinstance(command, types.StringType) else self.codec.dumps(command)
+        timeout = self.timeout if timeout is None else timeout
+        if not is_read_only(command):
+            return self._write(command, data, timeout, self._post_response)
+        return self._send(command, data, timeout, self._post_response)
+
+    def _send(self, command, data, timeout, post=None):
+        post = post or self._post
+        if self.limiter is None:
+            return post(data, timeout)
+
+        limiters = [self.limiter]
+        host_limiter = self.limiter.for_host(_host_of(command))
+        if host_limiter is not None:
+            # waiting on a busy host must not hold a controller wide slot
+            limiters.insert(0, host_limiter)
+
+        for limiter in limiters:
+            limiter.acquire()
+
+        start = time.time()
+        failed = False
+        try:
+            return post(data, timeout)
+        except ServerError:
+            failed = True
+            raise
+        finally:
+            latency = time.time() - start
+            for limiter in reversed(limiters):
+                limiter.release(latency, failed)
+
+    def _post(self, data, timeout=None):
+        response = self._post_response(data, timeout)
+
+        if response['outcome'] != "success":
+            raise CliError(response['failure-description'], response)
+
+        return response['result']
+
+    def _post_response(self, data, timeout=None):
         url = "http://{0}/management".format(self.controller)
-        headers = {"Content-type": "application/json"}
+        headers = {
+            "Content-type": "application/json",
+            "Accept-Encoding": "gzip, deflate" if self.compress else "identity"
+        }
 
-        data = command if isinstance(command, types.StringType) else json.dumps(command)
+        post = self.session.post if self.session is not None else requests.post
 
         try:
-            req = requests.post(
-                url,
-                data=data,
-                headers=headers,
-                auth=requests.auth.HTTPDigestAuth(
-                    self.credentials[0], self.credentials[1]
-                )
-            )
+            with self._phase("network"):
+                req = post(url, data=data, headers=headers, auth=self._auth, timeout=timeout)
 
         except Exception as ex:
             raise ServerError(
@@ -42,23 +648,417 @@ class Jbosscli(object):
                 "Request responded a {0} code".format(req.status_code)
             )
 
-        response = req.json()
+        with self._phase("decode"):
+            response = self.codec.decode_response(req)
 
         if 'outcome' not in response:
             raise CliError("Unknown error: {0}".format(req.text), response)
 
-        if response['outcome'] != "success":
-            raise CliError(response['failure-description'], response)
+        return response
 
-        return response['result']
+    def composite(self, steps):
+        """Runs steps in a single composite operation, returns their results in order"""
+        result = self.invoke_cli({
+            "operation": "composite",
+            "address": [],
+            "steps": steps
+        })
 
-    def _fetch_controller_data(self):
-        data = self.invoke_cli({
-            "operation": "read-resource",
-            "recursive-depth": 1,
-            "include-runtime": "true"
+        return [
+            result["step-{0}".format(i + 1)].get("result")
+            for i in range(len(steps))
+        ]
+
+    def read_projection(self, attributes, address=None):
+        """
+        Reads only the given attributes of the resource at address.
+        Wildcard addresses return a list of (address, attributes) tuples.
+        """
+        return _select(
+            self.invoke_cli(_projection_step(address or [])),
+            attributes
+        )
+
+    def query(self, address, where=None, select=None):
+        """
+        Runs the management query operation, filtering by the where attribute map
+        and keeping only select attributes on the server. Controllers without the
+        query operation are handled with a read-resource filtered on the client.
+        Wildcard addresses return a list of (address, attributes) tuples.
+        """
+        if self._query_supported:
+            command = {"operation": "query", "address": address}
+            if where:
+                command["where"] = where
+            if select:
+                command["select"] = select
+
+            try:
+                result = self.invoke_cli(command)
+            except CliError as ex:
+                if not _is_unknown_operation(ex):
+                    raise
+                self._query_supported = False
+            else:
+                if isinstance(result, list):
+                    # unmatched resources come back with an undefined result
+                    return [
+                        (item["address"], item["result"])
+                        for item in result
+                        if item.get("outcome") == "success" and item.get("result") is not None
+                    ]
+                return result
+
+        result = self.invoke_cli(_projection_step(address))
+        if isinstance(result, list):
+            matches = [
+                (item["address"], item["result"])
+                for item in result
+                if item.get("outcome") == "success" and _matches(item["result"], where)
+            ]
+            return matches if not select else [(a, _select(r, select)) for a, r in matches]
+
+        if not _matches(result, where):
+            return None
+        return result if not select else _select(result, select)
+
+    def refresh_status(self):
+        """
+        Re-reads the status of every server instance with one wildcard read.
+        The whole model is reloaded only if servers were added to or removed
+        from the loaded hosts. Servers of the master host are not modeled.
+        """
+        if not self.domain:
+            return
+
+        results = self.invoke_cli({
+            "operation": "read-attribute",
+            "name": "status",
+            "address": ["host", "*", "server-config", "*"]
+        })
+
+        hosts = self.topology.hosts
+        statuses = {}
+        for item in results:
+            host = hosts.get(_address_value(item["address"], "host"))
+            if host is None or host.master:
+                continue
+            key = (host.name, _address_value(item["address"], "server-config"))
+            statuses[key] = item.get("result") if item.get("outcome") == "success" else None
+
+        instances = self.topology.instances
+        if set(statuses) != set(instances):
+            self.refresh()
+            return
+
+        for key, status in statuses.iteritems():
+            if status is not None:
+                instances[key].status = status
+        self._topology = None
+
+    @property
+    def topology(self):
+        """TopologyIndex of the loaded model"""
+        if self._topology is None:
+            self._topology = TopologyIndex(self.hosts, getattr(self, "server_groups", []))
+        return self._topology
+
+    def get_host(self, name):
+        """Returns the Host named name, None if there is none"""
+        return self.topology.hosts.get(name)
+
+    def get_instance(self, name, host=None):
+        """
+        Returns the Instance named name on host, or on any host if host is None.
+        None if there is no such instance.
+        """
+        if host is not None:
+            return self.topology.instances.get((host, name))
+        found = self.topology.instances_by_name.get(name)
+        return found[0] if found else None
+
+    def get_instances(self, server_group=None, running=False):
+        """Returns all Instances, or those of server_group, optionally only the running ones"""
+        topology = self.topology
+        if server_group is None:
+            return topology.running_instances if running else topology.all_instances
+        index = topology.running_by_group if running else topology.instances_by_group
+        return index.get(server_group, [])
+
+    def get_server_group(self, name):
+        """Returns the ServerGroup named name, None if there is none"""
+        return self.topology.server_groups.get(name)
+
+    def get_server_groups(self, profile=None):
+        """Returns all ServerGroups, or those using profile"""
+        if profile is None:
+            return self.topology.server_groups.values()
+        return self.topology.groups_by_profile.get(profile, [])
+
+    def find_instances(self, where=None):
+        """
+        Returns the Instances whose server-config matches the where attribute map.
+        Without a loaded model their hosts are read with a single projection and
+        hold only the instances found.
+        """
+        matches = self.query(
+            ["host", "*", "server-config", "*"],
+            where,
+            PROJECTIONS["server-config"]
+        )
+        if not matches:
+            return []
+
+        loaded = self._model_loaded()
+        hosts = self.topology.hosts if loaded else self._read_hosts()
+
+        instances = []
+        for address, data in matches:
+            host = hosts.get(_address_value(address, "host"))
+            if host is not None:
+                instance = Instance(data, parent_host=host)
+                if not loaded:
+                    host.instances.append(instance)
+                instances.append(instance)
+
+        return instances
+
+    def find_deployments(self, where=None):
+        """
+        Returns the Deployments matching the where attribute map.
+        In domain mode, server group deployments are searched. Without a loaded
+        model their server groups are read with a single projection.
+        """
+        if not self._is_domain():
+            matches = self.query(["deployment", "*"], where, PROJECTIONS["deployment"])
+            return [Deployment(data, None, controller=self) for _, data in matches]
+
+        matches = self.query(
+            ["server-group", "*", "deployment", "*"],
+            where,
+            PROJECTIONS["deployment"]
+        )
+        if not matches:
+            return []
+
+        groups = self.topology.server_groups if self._model_loaded() else self._read_server_groups()
+
+        return [
+            Deployment(data, groups.get(_address_value(address, "server-group")), controller=self)
+            for address, data in matches
+        ]
+
+    def _model_loaded(self):
+        return "hosts" in self.__dict__
+
+    def _is_domain(self):
+        """Launch type from the loaded model, or read once when there is none"""
+        if self._model_loaded():
+            return self.domain
+        if self._launch_type is None:
+            self._launch_type = self.invoke_cli({
+                "operation": "read-attribute",
+                "name": "launch-type"
+            })
+        return self._launch_type == "DOMAIN"
+
+    def _read_hosts(self):
+        """Hosts by name, from a projection read and without their instances"""
+        hosts = {}
+        for address, data in self.query(["host", "*"], None, PROJECTIONS["host"]):
+            data["name"] = _address_value(address, "host")
+            data["server-config"] = {}
+            hosts[data["name"]] = Host(data, self)
+        return hosts
+
+    def _read_server_groups(self):
+        """Server groups by name, from a projection read and without their deployments"""
+        groups = {}
+        for address, data in self.query(["server-group", "*"], None, PROJECTIONS["server-group"]):
+            data["name"] = _address_value(address, "server-group")
+            groups[data["name"]] = ServerGroup(data, controller=self)
+        return groups
+
+    def iter_children(self, child_type, page_size=10, address=None, **read_options):
+        """
+        Yields (name, data) for each child_type child of address, reading the
+        children page_size at a time so only one window is held in memory.
+        read_options are passed on to each read-resource, e.g. include_runtime=True.
+        """
+        address = list(address or [])
+        names = self.invoke_cli({
+            "operation": "read-children-names",
+            "child-type": child_type,
+            "address": address
         })
 
+        for start in range(0, len(names), page_size):
+            window = names[start:start + page_size]
+            steps = []
+            for name in window:
+                step = {"operation": "read-resource", "address": address + [child_type, name]}
+                step.update((k.replace("_", "-"), v) for k, v in read_options.iteritems())
+                steps.append(step)
+
+            for name, data in zip(window, self.composite(steps)):
+                yield name, data
+
+    def iter_hosts(self, page_size=10):
+        """Yields the Hosts of the domain, reading page_size hosts per request"""
+        for _, data in self.iter_children(
+                "host", page_size, recursive_depth=1, include_runtime=True):
+            yield Host(data, controller=self)
+
+    def iter_server_groups(self, page_size=10):
+        """Yields the ServerGroups of the domain, reading page_size groups per request"""
+        for name, data in self.iter_children("server-group", page_size, recursive=True):
+            data["name"] = name
+            yield ServerGroup(data, controller=self)
+
+    def diff_system_properties(self, desired, remove=True):
+        """
+        Compares the loaded system properties against desired, a map of name to
+        value or to {"value": ..., "boot-time": ...}. Values are compared as strings,
+        boot-time only where desired gives it.
+        Properties missing from desired are removed unless remove is False.
+        """
+        current = dict((p.name, p) for p in self.system_properties)
+        changes = SystemPropertyChanges()
+
+        for name, prop in desired.iteritems():
+            prop = dict(prop) if isinstance(prop, dict) else {"value": prop}
+            if not isinstance(prop["value"], basestring):
+                prop["value"] = unicode(prop["value"])
+            existing = current.get(name)
+            if existing is not None and "boot-time" not in prop:
+                prop["boot-time"] = existing.boot_time
+            wanted = SystemProperty(name, prop)
+
+            if existing is None:
+                changes.added.append(wanted)
+                if wanted.boot_time:
+                    changes.reload_required.append(name)
+            elif existing.value != wanted.value or existing.boot_time != wanted.boot_time:
+                changes.updated.append(wanted)
+                changes.previous[name] = existing
+                if existing.value != wanted.value and (existing.boot_time or wanted.boot_time):
+                    changes.reload_required.append(name)
+
+        if remove:
+            for name, existing in current.iteritems():
+                if name not in desired:
+                    changes.removed.append(existing)
+                    if existing.boot_time:
+                        changes.reload_required.append(name)
+
+        return changes
+
+    def apply_system_properties(self, desired, remove=True, batch_size=100):
+        """
+        Brings the system properties to the desired state with composite operations
+        of up to batch_size steps. Returns the applied SystemPropertyChanges.
+        The loaded properties follow each batch that succeeds, so they stay
+        accurate when a later batch fails.
+        """
+        changes = self.diff_system_properties(desired, remove)
+        steps = changes.steps()
+        added = dict((p.name, p) for p in changes.added)
+        current = dict((p.name, p) for p in self.system_properties)
+
+        for start in range(0, len(steps), batch_size):
+            batch = steps[start:start + batch_size]
+            self.composite(batch)
+
+            for step in batch:
+                name = step["address"][1]
+                if step["operation"] == "add":
+                    current[name] = added[name]
+                elif step["operation"] == "remove":
+                    del current[name]
+                else:
+                    prop = copy.copy(current[name])
+                    if step["name"] == "value":
+                        prop.value = step["value"]
+                    else:
+                        prop.boot_time = step["value"]
+                    current[name] = prop
+            self.system_properties = current.values()
+
+        return changes
+
+    def check_datasources(self, max_workers=10, timeout=10):
+        """Health check of the datasources of all running instances, see check_datasources"""
+        self.refresh_status()
+        return check_datasources(self.get_instances(running=True), max_workers, timeout)
+
+    def _read_controller_projection(self):
+        root, properties, deployments = self.composite([
+            _projection_step([]),
+            {"operation": "read-children-resources", "child-type": "system-property"},
+            {"operation": "read-children-resources", "child-type": "deployment"}
+        ])
+
+        data = _select(root, PROJECTIONS["controller"])
+        data["system-property"] = dict(
+            (name, _select(prop, PROJECTIONS["system-property"]))
+            for name, prop in properties.iteritems()
+        )
+        data["deployment"] = dict(
+            (name, _select(d, PROJECTIONS["deployment"]))
+            for name, d in deployments.iteritems()
+        )
+
+        return data
+
+    def _read_host_projection(self):
+        hosts, configs = self.composite([
+            _projection_step(["host", "*"]),
+            _projection_step(["host", "*", "server-config", "*"])
+        ])
+
+        data = {}
+        for address, host in _select(hosts, PROJECTIONS["host"]):
+            host["server-config"] = {}
+            data[_address_value(address, "host")] = host
+
+        for address, config in _select(configs, PROJECTIONS["server-config"]):
+            host = data[_address_value(address, "host")]
+            host["server-config"][config["name"]] = config
+
+        return data
+
+    def _read_server_group_projection(self):
+        groups, deployments = self.composite([
+            _projection_step(["server-group", "*"]),
+            _projection_step(["server-group", "*", "deployment", "*"])
+        ])
+
+        data = {}
+        for address, group in _select(groups, PROJECTIONS["server-group"]):
+            group["deployment"] = {}
+            data[_address_value(address, "server-group")] = group
+
+        for address, deployment in _select(deployments, PROJECTIONS["deployment"]):
+            group = data[_address_value(address, "server-group")]
+            group["deployment"][deployment["name"]] = deployment
+
+        return data
+
+    def _phase(self, name):
+        profiler = getattr(self, "profiler", None)
+        return profiler.phase(name) if profiler is not None else _NO_PHASE
+
+    @_profiled("fetch_controller_data")
+    def _fetch_controller_data(self):
+        if self.projection:
+            data = self._read_controller_projection()
+        else:
+            data = self.invoke_cli({
+                "operation": "read-resource",
+                "recursive-depth": 1,
+                "include-runtime": "true"
+            })
+
         self.name = data["name"]
         self.product_name = data["product-name"]
         self.product_version = data["product-version"]
@@ -93,34 +1093,82 @@ class Jbosscli(object):
         else:
             self.deployments = []
 
-    def _fetch_host_data(self):
-        hosts = self.invoke_cli({
-            "operation": "read-children-resources",
-            "child-type": "host",
-            "recursive-depth": 1,
-            "include-runtime": True
-        })
+        self._topology = TopologyIndex(self.hosts, getattr(self, "server_groups", []))
 
+    @_profiled("fetch_host_data")
+    def _fetch_host_data(self):
+        if self.page_size:
+            self.hosts.extend(self.iter_hosts(self.page_size))
+            return
 
-        for key in hosts:
-            host_data = hosts[key]
-            self.hosts.append(
-                Host(host_data, controller=self)
-            )
+        if self.projection:
+            hosts = self._read_host_projection()
+        else:
+            hosts = self.invoke_cli({
+                "operation": "read-children-resources",
+                "child-type": "host",
+                "recursive-depth": 1,
+                "include-runtime": True
+            })
+
+        with self._phase("build"):
+            for key in hosts:
+                host_data = hosts[key]
+                self.hosts.append(
+                    Host(host_data, controller=self)
+                )
 
+    @_profiled("fetch_server_group_data")
     def _fetch_server_group_data(self):
+        if self.page_size:
+            self.server_groups.extend(self.iter_server_groups(self.page_size))
+            return
 
-        data = self.invoke_cli({
-            "operation": "read-children-resources",
-            "child-type": "server-group",
-            "recursive": True
-        })
-
-        for key in data:
-            group = data[key]
-            group["name"] = key
-
-            self.server_groups.append(ServerGroup(group, controller=self))
+        if self.projection:
+            data = self._read_server_group_projection()
+        else:
+            data = self.invoke_cli({
+                "operation": "read-children-resources",
+                "child-type": "server-group",
+                "recursive": True
+            })
+
+        with self._phase("build"):
+            for key in data:
+                group = data[key]
+                group["name"] = key
+
+                self.server_groups.append(ServerGroup(group, controller=self))
+
+class TopologyIndex(object):
+    """Lookups of hosts, instances and server groups, built once per model load"""
+    def __init__(self, hosts, server_groups=()):
+        self.hosts = {}
+        self.instances = {}
+        self.instances_by_name = {}
+        self.instances_by_group = {}
+        self.running_by_group = {}
+        self.all_instances = []
+        self.running_instances = []
+        self.server_groups = {}
+        self.groups_by_profile = {}
+
+        for host in hosts:
+            self.hosts[host.name] = host
+            for instance in host.instances:
+                self.instances[(host.name, instance.name)] = instance
+                self.instances_by_name.setdefault(instance.name, []).append(instance)
+                self.instances_by_group.setdefault(instance.server_group_name, []).append(instance)
+                self.all_instances.append(instance)
+                if instance.running():
+                    self.running_by_group.setdefault(
+                        instance.server_group_name, []
+                    ).append(instance)
+                    self.running_instances.append(instance)
+
+        for group in server_groups:
+            self.server_groups[group.name] = group
+            self.groups_by_profile.setdefault(group.profile, []).append(group)
 
 class CliError(Exception):
     """Generic class representing runtime errors in the server"""
@@ -167,22 +1215,14 @@ class Host(object):
         returns a map with the memory state of the host or instance, if provided
         """
 
-        command = {
-            "operation": "read-resource",
-            "include-runtime": "true",
-            "address": [
-                "core-service",
-                "platform-mbean",
-                "type",
-                "memory"
-            ]
-        }
+        address_prefix = ["host", self.name, "server", instance.name] if instance else None
 
-        if instance:
-            command["address"] = ["host", self.name, "server", instance.name] + command["address"]
-
-        return self.controller.invoke_cli(command)
+        return self.controller.invoke_cli(_MEMORY_STATUS.render(address_prefix))
 
+    def follow_logs(self, name="server.log", interval=1.0, **options):
+        """Follows the log of every running instance, see follow_logs"""
+        instances = [i for i in self.instances if i.running()]
+        return follow_logs(instances, name, interval, **options)
 
 
 class Instance(object):
@@ -226,6 +1266,35 @@ class Instance(object):
         """Return the current heap and non-heap memory status"""
         return self.host.read_memory_status(self)
 
+    def log_tail(self, name="server.log", backlog=10, page_size=500):
+        """Return a LogTail of the instance log file"""
+        return LogTail(
+            self.host.controller,
+            ["host", self.host.name, "server", self.name],
+            name, backlog, page_size
+        )
+
+    def follow_log(self, name="server.log", interval=1.0, **options):
+        """Yields the new lines of the instance log file as they are written"""
+        for _, line in follow_logs([self], name, interval, **options):
+            yield line
+
+    def read_thread_dump(self, stacks=None):
+        """Return a ThreadDump of all threads in the instance"""
+        threads = self.host.controller.invoke_cli({
+            "operation": "dump-all-threads",
+            "locked-monitors": False,
+            "locked-synchronizers": False,
+            "address": [
+                "host", self.host.name,
+                "server", self.name,
+                "core-service", "platform-mbean",
+                "type", "threading"
+            ]
+        })
+
+        return ThreadDump(self, threads, stacks)
+
     def running(self):
         """Return True if status is \"STARTED\""""
         return self.status == "STARTED"
@@ -264,7 +1333,8 @@ class DataSource(object):
             self.max_used_connections = pool_stats["MaxUsedCount"]
             self.max_wait_time = pool_stats["MaxWaitTime"]
 
-    def test_connection_in_pool(self):
+    def test_connection_in_pool(self, timeout=None):
+        """Tests a connection of the pool, failing after timeout seconds if given"""
         command = {
             "operation": "test-connection-in-pool",
             "address": [
@@ -275,7 +1345,7 @@ class DataSource(object):
             ]
         }
 
-        return self.instance.host.controller.invoke_cli(command)
+        return self.instance.host.controller.invoke_cli(command, timeout=timeout)
 
     def __str__(self):
         return self.name
@@ -283,6 +1353,27 @@ class DataSource(object):
     def __repr__(self):
         return self.__str__()
 
+class DataSourceHealth(object):
+    """Outcome of a connection test along with the pool usage of a datasource"""
+    def __init__(self, datasource, error=None):
+        self.datasource = datasource
+        self.instance = datasource.instance
+        self.error = error
+        self.ok = error is None
+        self.in_use_connections = getattr(datasource, "in_use_connections", None)
+        self.max_pool_size = datasource.max_pool_size
+        self.max_wait_time = getattr(datasource, "max_wait_time", None)
+
+        if self.in_use_connections is not None and self.max_pool_size:
+            self.saturation = float(self.in_use_connections) / self.max_pool_size
+        else:
+            self.saturation = None
+
+    def __repr__(self):
+        return "DataSourceHealth('{0}', '{1}', ok={2}, saturation={3})".format(
+            self.instance, self.datasource, self.ok, self.saturation
+        )
+
 
 class ServerGroup(object):
     """Represents a server group configuration"""
@@ -335,8 +1426,10 @@ class Deployment(object):
         if not self.enabled or self.runtime_name.endswith(".jar"):
             return None
         if self.controller.domain:
-            insts = []
-            map(lambda x: insts.extend(x.instances), self.controller.hosts)
+            if self.server_group is not None:
+                insts = self.controller.get_instances(self.server_group.name, running=True)
+            else:
+                insts = self.controller.get_instances()
 
             for instance in insts:
                 context_root = ""
@@ -394,3 +1487,492 @@ class SystemProperty(object):
         return self.name == other.name and \
                self.value == other.value and \
                self.boot_time == other.boot_time
+
+
+def _format_frame(frame):
+    if frame.get("native-method"):
+        location = u"Native Method"
+    elif frame.get("file-name"):
+        location = u"{0}:{1}".format(frame["file-name"], frame.get("line-number"))
+    else:
+        location = u"Unknown Source"
+
+    # intern() only accepts byte strings, frames may name non-ASCII classes
+    text = u"{0}.{1}({2})".format(frame["class-name"], frame["method-name"], location)
+    return intern(text.encode("utf-8"))
+
+class ThreadDump(object):
+    """
+    Compact thread dump of an instance, a list of (name, state, stack) tuples.
+    Dumps sharing a stacks map store identical stacks only once.
+    """
+    def __init__(self, instance, threads, stacks=None):
+        self.instance = instance
+        stacks = {} if stacks is None else stacks
+        self.threads = []
+        for thread in threads:
+            stack = tuple(_format_frame(f) for f in thread.get("stack-trace") or [])
+            self.threads.append(
+                (thread["thread-name"], thread["thread-state"], stacks.setdefault(stack, stack))
+            )
+
+    def __repr__(self):
+        return "ThreadDump('{0}', {1} threads)".format(self.instance, len(self.threads))
+
+class StackSummary(object):
+    """Threads sharing the same stack across one or more instances"""
+    def __init__(self, stack):
+        self.stack = stack
+        self.count = 0
+        self.states = {}
+        self.instances = {}
+
+    def add(self, instance, name, state):
+        """Accounts for one more thread with this stack"""
+        self.count += 1
+        self.states[state] = self.states.get(state, 0) + 1
+        self.instances.setdefault(instance, []).append(name)
+
+    def __repr__(self):
+        return "StackSummary({0} threads, {1} instances, {2} frames)".format(
+            self.count, len(self.instances), len(self.stack)
+        )
+
+def _run_concurrently(func, items, max_workers=10):
+    """
+    Calls func on each item using up to max_workers threads.
+    Returns a list of (item, result, error) in the order of items.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    pending = Queue.Queue()
+    for index in range(len(items)):
+        pending.put(index)
+
+    def worker():
+        while True:
+            try:
+                index = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[index] = (items[index], func(items[index]), None)
+            except Exception as ex:
+                results[index] = (items[index], None, ex)
+
+    workers = [threading.Thread(target=worker) for _ in range(min(max_workers, len(items)))]
+    for thread in workers:
+        thread.daemon = True
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    return results
+
+def capture_thread_dumps(instances, max_workers=20):
+    """
+    Dumps the threads of all instances at once.
+    Returns a list of ThreadDumps and a map of instance to error for failed dumps.
+    """
+    dumps = []
+    errors = {}
+    stacks = {}
+    for instance, dump, error in _run_concurrently(
+            lambda i: i.read_thread_dump(stacks), instances, max_workers):
+        if error is not None:
+            errors[instance] = error
+        else:
+            dumps.append(dump)
+
+    return dumps, errors
+
+def aggregate_stacks(dumps, top=None):
+    """Groups identical stacks of many ThreadDumps, most frequent first"""
+    summaries = {}
+    for dump in dumps:
+        for name, state, stack in dump.threads:
+            summary = summaries.get(stack)
+            if summary is None:
+                summary = summaries[stack] = StackSummary(stack)
+            summary.add(dump.instance, name, state)
+
+    ranked = sorted(summaries.values(), key=lambda s: (-s.count, -len(s.instances)))
+    return ranked[:top] if top else ranked
+
+def check_datasources(instances, max_workers=10, timeout=10):
+    """
+    Tests the connection of every enabled datasource of the running instances at once.
+    The datasources are read again on every call, so pool usage is current.
+    Returns DataSourceHealths, most saturated first, and a map of instance to error
+    for instances whose datasources could not be read.
+    """
+    errors = {}
+    datasources = []
+    running = [i for i in instances if i.running()]
+    for instance, found, error in _run_concurrently(
+            lambda i: i._read_datasources(), running, max_workers):
+        if error is not None:
+            errors[instance] = error
+        else:
+            instance._datasources = found
+            datasources.extend(ds for ds in found if ds.enabled)
+
+    healths = [
+        DataSourceHealth(ds, error)
+        for ds, _, error in _run_concurrently(
+            lambda ds: ds.test_connection_in_pool(timeout), datasources, max_workers)
+    ]
+    healths.sort(key=lambda h: -1 if h.saturation is None else h.saturation, reverse=True)
+
+    return healths, errors
+
+class SystemPropertyChanges(object):
+    """System properties to add, update and remove, and which of them need a reload"""
+    def __init__(self):
+        self.added = []
+        self.updated = []
+        self.removed = []
+        self.reload_required = []
+        # name -> loaded SystemProperty, for each updated one
+        self.previous = {}
+
+    def steps(self):
+        """Returns the management operations applying the changes"""
+        steps = []
+        for prop in self.added:
+            step = {
+                "operation": "add",
+                "address": ["system-property", prop.name],
+                "value": prop.value
+            }
+            if prop.boot_time:
+                step["boot-time"] = True
+            steps.append(step)
+
+        for prop in self.updated:
+            previous = self.previous.get(prop.name)
+            if previous is None or previous.value != prop.value:
+                steps.append({
+                    "operation": "write-attribute",
+                    "address": ["system-property", prop.name],
+                    "name": "value",
+                    "value": prop.value
+                })
+            if previous is None or previous.boot_time != prop.boot_time:
+                steps.append({
+                    "operation": "write-attribute",
+                    "address": ["system-property", prop.name],
+                    "name": "boot-time",
+                    "value": prop.boot_time
+                })
+
+        for prop in self.removed:
+            steps.append({
+                "operation": "remove",
+                "address": ["system-property", prop.name]
+            })
+
+        return steps
+
+    def __len__(self):
+        return len(self.added) + len(self.updated) + len(self.removed)
+
+    def __repr__(self):
+        return "SystemPropertyChanges(added={0}, updated={1}, removed={2}, reload={3})".format(
+            len(self.added), len(self.updated), len(self.removed), self.reload_required
+        )
+
+class _SnapshotMiss(Exception):
+    """A model load asked for a response missing from the cached snapshot"""
+
+class ModelCache(object):
+    """
+    On disk cache of the model loaded by Jbosscli, shared between processes.
+    A cached model younger than max_age seconds is used as is. An older one is
+    used if a small fingerprint read (host and server states, deployment and
+    system property names) still matches, otherwise the model is fetched again.
+    """
+    def __init__(self, directory, max_age=60):
+        self.directory = directory
+        self.max_age = max_age
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+
+        try:
+            os.makedirs(directory)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+
+    def load(self, cli):
+        """Loads the model of cli from the cache, fetching it if needed"""
+        path = self._path(cli)
+
+        with self._lock(path):
+            entry = self._read(path)
+
+            if entry is not None and time.time() - entry["created"] < self.max_age:
+                if self._replay(cli, entry):
+                    self.hits += 1
+                    return
+
+            fingerprint = None
+            if entry is not None:
+                fingerprint = self._fingerprint(cli, entry["domain"])
+                if fingerprint is not None and fingerprint == entry["fingerprint"] \
+                        and self._replay(cli, entry):
+                    self.revalidations += 1
+                    entry["created"] = time.time()
+                    self._write(path, entry)
+                    return
+
+            self.misses += 1
+            responses = {}
+            cli._snapshot = (True, responses)
+            try:
+                cli._fetch_controller_data()
+            finally:
+                cli._snapshot = None
+
+            if fingerprint is None or entry["domain"] != cli.domain:
+                fingerprint = self._fingerprint(cli, cli.domain)
+
+            self._write(path, {
+                "created": time.time(),
+                "domain": cli.domain,
+                "fingerprint": fingerprint,
+                "responses": responses
+            })
+
+    def invalidate(self, cli):
+        """Drops the cached model of cli"""
+        try:
+            os.remove(self._path(cli))
+        except OSError as ex:
+            if ex.errno != errno.ENOENT:
+                raise
+
+    def _path(self, cli):
+        # Per user: RBAC roles change what the model holds, system property values included
+        key = "{0}|{1}|{2}|{3}".format(
+            cli.controller, cli.credentials[0], cli.projection, cli.page_size
+        )
+        return os.path.join(self.directory, hashlib.sha1(key).hexdigest() + ".json")
+
+    @contextlib.contextmanager
+    def _lock(self, path):
+        # Only one process refreshes a model at a time, others wait and reuse it
+        if fcntl is None:
+            yield
+            return
+
+        with open(path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self, path):
+        try:
+            with open(path, "rb") as cached:
+                return json.load(cached)
+        except (IOError, ValueError):
+            return None
+
+    def _write(self, path, entry):
+        # Write then rename, so readers never see a partial file
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as temp:
+                json.dump(entry, temp, separators=(",", ":"))
+            if os.name == "nt" and os.path.exists(path):
+                os.remove(path)
+            os.rename(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _replay(self, cli, entry):
+        cli._snapshot = (False, entry["responses"])
+        try:
+            cli._fetch_controller_data()
+            return True
+        except _SnapshotMiss:
+            return False
+        finally:
+            cli._snapshot = None
+
+    def _fingerprint(self, cli, domain):
+        steps = [
+            {"operation": "read-attribute", "name": "launch-type"},
+            {"operation": "read-children-names", "child-type": "deployment"},
+            {"operation": "read-children-names", "child-type": "system-property"}
+        ]
+        if domain:
+            steps.extend([
+                {"operation": "read-children-names", "child-type": "host"},
+                {"operation": "read-children-names", "child-type": "server-group"},
+                {
+                    "operation": "read-attribute", "name": "host-state",
+                    "address": ["host", "*"]
+                },
+                {
+                    "operation": "read-attribute", "name": "status",
+                    "address": ["host", "*", "server-config", "*"]
+                },
+                {
+                    "operation": "read-attribute", "name": "enabled",
+                    "address": ["server-group", "*", "deployment", "*"]
+                }
+            ])
+
+        try:
+            result = cli.composite(steps)
+        except (CliError, ServerError):
+            return None
+
+        return hashlib.sha1(json.dumps(result, sort_keys=True)).hexdigest()
+
+class LogTail(object):
+    """
+    Reads a server log file incrementally with read-log-file, keeping the line
+    offset reached so each poll only transfers the lines written since.
+    The first poll returns the last backlog lines.
+    """
+    def __init__(self, controller, address_prefix, name="server.log", backlog=10, page_size=500):
+        self.controller = controller
+        self.address_prefix = list(address_prefix)
+        self.name = name
+        self.backlog = backlog
+        self.page_size = page_size
+        self.offset = None
+        self._last_line = None
+        self._legacy = False
+
+    def poll(self):
+        """Returns the lines written since the last poll"""
+        if self.offset is None:
+            count = self._count_lines()
+            self.offset = max(0, count - self.backlog)
+            if count and not self.backlog:
+                self._last_line = self._read(count - 1, 1)[0]
+
+        lines = []
+        while True:
+            page = self._read(self.offset, self.page_size)
+            lines.extend(page)
+            self.offset += len(page)
+            if len(page) < self.page_size:
+                break
+
+        if lines:
+            self._last_line = lines[-1]
+        elif self._rotated():
+            self.offset = 0
+            self._last_line = None
+            return self.poll()
+
+        return lines
+
+    def _rotated(self):
+        """True if the line before offset is no longer the last line read"""
+        if not self.offset:
+            return False
+        return self._read(self.offset - 1, 1) != [self._last_line]
+
+    def _count_lines(self):
+        # Exponential then binary search on single line reads
+        low, high = 0, 1024
+        while self._read(high - 1, 1):
+            low, high = high, high * 2
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self._read(middle - 1, 1):
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def _read(self, skip, lines):
+        command = {
+            "operation": "read-log-file",
+            "lines": lines,
+            "skip": skip,
+            "tail": False
+        }
+        if self._legacy:
+            command["name"] = self.name
+            command["address"] = self.address_prefix + ["subsystem", "logging"]
+        else:
+            command["address"] = self.address_prefix + [
+                "subsystem", "logging", "log-file", self.name
+            ]
+
+        try:
+            return self.controller.invoke_cli(command)
+        except CliError as ex:
+            if self._legacy or not (_is_missing_resource(ex) or _is_unknown_operation(ex)):
+                raise
+            error = ex
+
+        # Before WildFly 10 read-log-file lived on the logging subsystem
+        self._legacy = True
+        try:
+            return self._read(skip, lines)
+        except CliError as ex:
+            if not _is_unknown_operation(ex):
+                raise
+            # not a legacy server either, the log file itself is missing
+            self._legacy = False
+            raise error
+
+def follow_logs(instances, name="server.log", interval=1.0, max_buffered=1000,
+                max_workers=10, backlog=10, errors=None):
+    """
+    Yields (instance, line) for the lines written to the log file of each
+    instance, polling them all concurrently every interval seconds.
+    At most max_buffered lines wait to be consumed; polling pauses meanwhile.
+    errors, if given, maps each instance to the error of its last poll while
+    it keeps failing; failed instances are polled again on the next round.
+    """
+    tails = [(i, i.log_tail(name, backlog)) for i in instances]
+    lines = Queue.Queue(max_buffered)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                lines.put(item, timeout=0.1)
+                return
+            except Queue.Full:
+                pass
+
+    def poller():
+        while not stop.is_set():
+            for (instance, _), new_lines, error in _run_concurrently(
+                    lambda tail: tail[1].poll(), tails, max_workers):
+                if errors is not None:
+                    if error is not None:
+                        errors[instance] = error
+                    else:
+                        errors.pop(instance, None)
+                for line in new_lines or []:
+                    put((instance, line))
+            stop.wait(interval)
+
+    thread = threading.Thread(target=poller)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            try:
+                yield lines.get(timeout=0.1)
+            except Queue.Empty:
+                if not thread.is_alive():
+                    return
+    finally:
+        stop.set()
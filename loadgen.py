@@ -0,0 +1,284 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Load generator measuring how many management requests a controller sustains.
+
+Sends a weighted mix of operations through Jbosscli.invoke_cli, either with a
+fixed number of concurrent clients or at a target rate, and reports
+throughput, latency percentiles and error rates per operation.
+
+Usage: python loadgen.py controller:port|stub user:password
+           [--mix root=1,memory=5,datasources=2]
+           [--concurrency N | --rate R] [--duration SECONDS]
+"""
+
+import sys
+import time
+import random
+import argparse
+import threading
+import Queue
+
+import requests
+
+from jbosscli import Jbosscli
+from jbosscli import CliError
+from jbosscli import ServerError
+from jbosscli import PreparedOperation
+
+_ROOT = PreparedOperation({
+    "operation": "read-resource",
+    "include-runtime": True
+})
+
+_MEMORY = PreparedOperation({
+    "operation": "read-resource",
+    "include-runtime": True,
+    "address": ["core-service", "platform-mbean", "type", "memory"]
+})
+
+_DATASOURCES = PreparedOperation({
+    "operation": "read-children-resources",
+    "child-type": "data-source",
+    "include-runtime": True,
+    "recursive": True,
+    "address": ["subsystem", "datasources"]
+})
+
+# operation name -> function of a server address prefix returning the payload
+OPERATIONS = {
+    "root": lambda prefix: _ROOT.render(),
+    "memory": _MEMORY.render,
+    "datasources": _DATASOURCES.render
+}
+
+def parse_mix(text):
+    """Parses "root=1,memory=5" into {"root": 1, "memory": 5}"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise ValueError("Unknown operation: {0}".format(name))
+        mix[name] = float(weight or 1)
+    return mix
+
+def percentile(values, fraction):
+    """Nearest rank percentile of sorted values"""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+class OperationStats(object):
+    """Latencies and errors of one operation"""
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.errors = {}
+
+    @property
+    def count(self):
+        """Requests sent, failed ones included"""
+        return len(self.latencies) + sum(self.errors.values())
+
+    @property
+    def error_rate(self):
+        """Fraction of the requests that failed"""
+        return float(sum(self.errors.values())) / self.count if self.count else 0.0
+
+class LoadReport(object):
+    """Outcome of a load run"""
+    def __init__(self, stats, elapsed):
+        self.stats = stats
+        self.elapsed = elapsed
+
+    @property
+    def requests(self):
+        """Requests sent in the run"""
+        return sum(s.count for s in self.stats.values())
+
+    @property
+    def throughput(self):
+        """Requests per second"""
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    def format(self):
+        """Returns the report as a table"""
+        lines = [
+            "{0} requests in {1:.2f} s, {2:.1f} requests/s".format(
+                self.requests, self.elapsed, self.throughput
+            ),
+            "{0:<12} {1:>8} {2:>8} {3:>10} {4:>10} {5:>10} {6:>10}".format(
+                "operation", "requests", "errors", "p50 ms", "p90 ms", "p99 ms", "max ms"
+            )
+        ]
+        for name in sorted(self.stats):
+            stats = self.stats[name]
+            latencies = sorted(stats.latencies)
+            lines.append("{0:<12} {1:>8} {2:>7.1%} {3:>10} {4:>10} {5:>10} {6:>10}".format(
+                name,
+                stats.count,
+                stats.error_rate,
+                _ms(percentile(latencies, 0.5)),
+                _ms(percentile(latencies, 0.9)),
+                _ms(percentile(latencies, 0.99)),
+                _ms(latencies[-1] if latencies else None)
+            ))
+            for error, count in sorted(stats.errors.items()):
+                lines.append("    {0}: {1}".format(error, count))
+        return "\n".join(lines)
+
+def _ms(seconds):
+    return "-" if seconds is None else "{0:.2f}".format(seconds * 1e3)
+
+class LoadGenerator(object):
+    """
+    Sends a weighted mix of operations to the controller of cli.
+    Per server operations go to a random address prefix of targets.
+    """
+    def __init__(self, cli, mix, targets=None):
+        self.cli = cli
+        self.mix = mix
+        self.targets = targets or [[]]
+        self._names = sorted(mix)
+        self._weights = [mix[name] for name in self._names]
+
+    def _pick(self):
+        threshold = random.uniform(0, sum(self._weights))
+        for name, weight in zip(self._names, self._weights):
+            threshold -= weight
+            if threshold <= 0:
+                return name
+        return self._names[-1]
+
+    def _send(self, stats, lock, scheduled=None):
+        name = self._pick()
+        payload = OPERATIONS[name](random.choice(self.targets))
+        start = time.time() if scheduled is None else scheduled
+        try:
+            self.cli.invoke_cli(payload)
+            error = None
+        except (CliError, ServerError) as ex:
+            error = type(ex).__name__
+        latency = time.time() - start
+
+        with lock:
+            operation = stats[name]
+            if error is None:
+                operation.latencies.append(latency)
+            else:
+                operation.errors[error] = operation.errors.get(error, 0) + 1
+
+    def run(self, duration=10, concurrency=None, rate=None):
+        """
+        Sends requests for duration seconds, either from concurrency clients in
+        closed loop or at rate requests per second. Rated latencies are measured
+        from the scheduled send time, so a saturated controller shows up in them.
+        """
+        stats = dict((name, OperationStats(name)) for name in self._names)
+        lock = threading.Lock()
+        start = time.time()
+        deadline = start + duration
+
+        if rate:
+            self._run_rated(stats, lock, deadline, rate, concurrency or 64)
+        else:
+            self._run_closed(stats, lock, deadline, concurrency or 1)
+
+        return LoadReport(stats, time.time() - start)
+
+    def _run_closed(self, stats, lock, deadline, concurrency):
+        def client():
+            while time.time() < deadline:
+                self._send(stats, lock)
+
+        self._join([threading.Thread(target=client) for _ in range(concurrency)])
+
+    def _run_rated(self, stats, lock, deadline, rate, workers):
+        scheduled = Queue.Queue()
+
+        def worker():
+            while True:
+                when = scheduled.get()
+                if when is None:
+                    return
+                self._send(stats, lock, when)
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+
+        interval = 1.0 / rate
+        when = time.time()
+        while when < deadline:
+            delay = when - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            scheduled.put(when)
+            when += interval
+
+        for _ in threads:
+            scheduled.put(None)
+        for thread in threads:
+            thread.join()
+
+    def _join(self, threads):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+def connect(controller, auth, pool_size=64):
+    """
+    A Jbosscli for load tests: pooled connections and no coalescing, so every
+    request reaches the controller. Returns it with the running servers'
+    address prefixes.
+    """
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size
+    ))
+    cli = Jbosscli(controller, auth, session=session, coalesce=False)
+
+    targets = [
+        ["host", i.host.name, "server", i.name]
+        for i in cli.get_instances(running=True)
+    ] if cli.domain else [[]]
+
+    return cli, targets
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Management API load generator")
+    parser.add_argument("controller", help="host:port, or stub for a local stub controller")
+    parser.add_argument("auth", help="user:password")
+    parser.add_argument("--mix", default="root=1,memory=5,datasources=2")
+    parser.add_argument("--concurrency", type=int, help="concurrent clients")
+    parser.add_argument("--rate", type=float, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    args = parser.parse_args(argv[1:])
+
+    server = None
+    controller = args.controller
+    if controller == "stub":
+        import stub
+        server = stub.StubController()
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        controller = server.controller
+
+    cli, targets = connect(controller, args.auth, max(64, args.concurrency or 0))
+    try:
+        generator = LoadGenerator(cli, parse_mix(args.mix), targets)
+        print generator.run(args.duration, args.concurrency, args.rate).format()
+    finally:
+        cli.session.close()
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,262 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Caching read-through proxy for a Jboss controller.
+
+Speaks the /management JSON protocol, relaying the controller's full response
+bodies. Read operations are cached for a while and coalesced, writes are passed
+through and invalidate the cached reads of the addresses they touch.
+
+Clients are not authenticated, they act with the proxy's credentials, so
+writes are refused unless --allow-writes is given.
+
+Usage: python proxy.py controller:port user:password [listen_port] [ttl] [--allow-writes]
+"""
+
+import sys
+import json
+import time
+import threading
+import collections
+import BaseHTTPServer
+import SocketServer
+
+import requests
+
+from jbosscli import Jbosscli
+from jbosscli import CliError
+from jbosscli import ServerError
+from jbosscli import is_read_only
+from jbosscli import _Flight
+
+def _normalize_address(address):
+    """Turns ["host", "h1"] or [{"host": "h1"}] into (("host", "h1"),)"""
+    if not address:
+        return ()
+    if isinstance(address, dict):
+        address = [address]
+    if isinstance(address[0], dict):
+        pairs = [item for element in address for item in element.items()]
+    else:
+        pairs = zip(address[0::2], address[1::2])
+    return tuple((unicode(key), unicode(value)) for key, value in pairs)
+
+def _addresses(command):
+    """Returns the normalized addresses a command touches, composite steps included"""
+    if command.get("operation") == "composite":
+        return [
+            address
+            for step in command.get("steps", [])
+            for address in _addresses(step)
+        ]
+    return [_normalize_address(command.get("address"))]
+
+def _is_command(command):
+    """True if command is an operation object, composite steps included"""
+    if not isinstance(command, dict):
+        return False
+    if command.get("operation") == "composite":
+        steps = command.get("steps", [])
+        return isinstance(steps, list) and all(_is_command(step) for step in steps)
+    return True
+
+def _overlaps(address, other):
+    """True if one address is a prefix of the other, wildcards matching anything"""
+    for (key, value), (other_key, other_value) in zip(address, other):
+        if key != other_key:
+            return False
+        if value != other_value and "*" not in (value, other_value):
+            return False
+    return True
+
+class _Entry(object):
+    def __init__(self, response, addresses, expires):
+        self.response = response
+        self.addresses = addresses
+        self.expires = expires
+
+class CachingProxy(object):
+    """
+    Answers management commands, caching read results for ttl seconds.
+    Each invalidation starts a new generation: reads in flight from an older
+    one are neither cached nor joined by later reads.
+    """
+    def __init__(self, cli, ttl=5.0, max_entries=10000, allow_writes=False):
+        self.cli = cli
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.allow_writes = allow_writes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.coalesced = 0
+        self._cache = collections.OrderedDict()
+        self._inflight = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def handle(self, command):
+        """Returns the full management response for command"""
+        if not is_read_only(command):
+            return self._write(command)
+
+        key = json.dumps(command, sort_keys=True)
+        now = time.time()
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry.expires > now:
+                self.hits += 1
+                return entry.response
+            self.misses += 1
+
+            generation = self._generation
+            flight = self._inflight.get((generation, key))
+            leader = flight is None
+            if leader:
+                flight = self._inflight[(generation, key)] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return flight.wait()
+
+        try:
+            response = flight.result = self._invoke(command)
+        except Exception as ex:
+            flight.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[(generation, key)]
+            flight.done.set()
+
+        if response["outcome"] == "success":
+            with self._lock:
+                if self._generation != generation:
+                    # a write landed while reading, the result may predate it
+                    return response
+                self._cache.pop(key, None)
+                self._cache[key] = _Entry(response, _addresses(command), now + self.ttl)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+
+        return response
+
+    def invalidate(self, addresses):
+        """Drops cached reads overlapping any of the normalized addresses"""
+        with self._lock:
+            self._generation += 1
+            stale = [
+                key for key, entry in self._cache.iteritems()
+                if any(_overlaps(a, b) for a in entry.addresses for b in addresses)
+            ]
+            for key in stale:
+                del self._cache[key]
+
+    def _write(self, command):
+        with self._lock:
+            self.writes += 1
+        try:
+            return self._invoke(command)
+        finally:
+            self.invalidate(_addresses(command))
+
+    def _invoke(self, command):
+        try:
+            return self.cli.invoke_raw(command)
+        except CliError as ex:
+            return {"outcome": "failed", "failure-description": ex.msg}
+
+class ProxyRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves POST /management from the server's CachingProxy"""
+    def do_POST(self):
+        if self.path.rstrip("/") != "/management":
+            self.send_error(404)
+            return
+
+        body = self.rfile.read(int(self.headers.getheader("Content-Length", 0)))
+
+        try:
+            command = self.server.proxy.cli.codec.loads(body)
+        except ValueError:
+            self._respond(400, {"outcome": "failed", "failure-description": "Invalid JSON"})
+            return
+
+        if not _is_command(command):
+            self._respond(400, {
+                "outcome": "failed",
+                "failure-description": "Expected an operation object"
+            })
+            return
+
+        if not self.server.proxy.allow_writes and not is_read_only(command):
+            self._respond(403, {
+                "outcome": "failed",
+                "failure-description": "Writes are disabled on this proxy"
+            })
+            return
+
+        try:
+            response = self.server.proxy.handle(command)
+        except ServerError as ex:
+            self._respond(502, {"outcome": "failed", "failure-description": ex.msg})
+            return
+
+        self._respond(200 if response["outcome"] == "success" else 500, response)
+
+    def _respond(self, status, response):
+        body = self.server.proxy.cli.codec.dumps(response)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class ProxyServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Threaded HTTP server in front of a CachingProxy"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, proxy):
+        BaseHTTPServer.HTTPServer.__init__(self, address, ProxyRequestHandler)
+        self.proxy = proxy
+
+def create_proxy(controller, auth, ttl=5.0, pool_size=10, bind=("127.0.0.1", 9991),
+                 allow_writes=False):
+    """
+    Builds a ProxyServer sharing one pooled connection to controller.
+    Write operations are refused unless allow_writes is True.
+    """
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size
+    ))
+    cli = Jbosscli(controller, auth, session=session, fetch_model=False)
+    return ProxyServer(bind, CachingProxy(cli, ttl=ttl, allow_writes=allow_writes))
+
+def main(argv):
+    allow_writes = "--allow-writes" in argv
+    argv = [arg for arg in argv if arg != "--allow-writes"]
+    if len(argv) < 3:
+        print __doc__
+        return 1
+
+    port = int(argv[3]) if len(argv) > 3 else 9991
+    ttl = float(argv[4]) if len(argv) > 4 else 5.0
+
+    server = create_proxy(
+        argv[1], argv[2], ttl=ttl, bind=("127.0.0.1", port), allow_writes=allow_writes
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
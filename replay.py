@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Record and replay of management traffic.
+
+Both classes plug into Jbosscli as its session:
+
+    cli = Jbosscli("host:port", "user:password", session=RecordingSession("domain.rec"))
+    cli = Jbosscli("host:port", "user:password", session=ReplaySession("domain.rec"))
+
+Recordings are gzipped JSON lines, one request/response pair per line, along
+with the controller it was sent to. Credentials are never recorded and password
+attributes are redacted.
+"""
+
+import gzip
+import json
+import time
+import urlparse
+import threading
+
+import requests
+
+REDACTED = "***"
+
+def _redact(data):
+    """Replaces the value of any password or credential attribute"""
+    if isinstance(data, dict):
+        return dict(
+            (key, REDACTED if _is_secret(key) else _redact(value))
+            for key, value in data.iteritems()
+        )
+    if isinstance(data, list):
+        return [_redact(item) for item in data]
+    return data
+
+def _is_secret(key):
+    key = key.lower()
+    return "password" in key or "credential" in key
+
+def _request_key(request):
+    return json.dumps(request, sort_keys=True)
+
+def _controller(url):
+    """Returns host:port of a management url"""
+    return urlparse.urlsplit(url).netloc
+
+class RecordingSession(object):
+    """Sends requests through session and records each exchange in path"""
+    def __init__(self, path, session=None):
+        self.session = session if session is not None else requests.Session()
+        self._file = gzip.open(path, "ab")
+        self._lock = threading.Lock()
+
+    def post(self, url, data=None, **kwargs):
+        """Same as requests.post, recording the exchange"""
+        start = time.time()
+        resp = self.session.post(url, data=data, **kwargs)
+        latency = time.time() - start
+
+        try:
+            body = json.dumps(_redact(json.loads(resp.content)))
+        except ValueError:
+            body = resp.text
+
+        line = json.dumps({
+            "controller": _controller(url),
+            "request": _redact(json.loads(data)),
+            "status": resp.status_code,
+            "response": body,
+            "latency": round(latency, 6)
+        }, separators=(",", ":"))
+
+        with self._lock:
+            self._file.write(line + "\n")
+
+        return resp
+
+    def close(self):
+        """Flushes and closes the recording"""
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class ReplayResponse(object):
+    """The parts of a requests Response used by Jbosscli"""
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode("utf-8") if isinstance(text, unicode) else text
+
+    def json(self):
+        """Parses the body as JSON"""
+        return json.loads(self.content)
+
+class ReplaySession(object):
+    """
+    Serves recorded responses, waiting the recorded latency times latency_scale.
+    Requests are answered from the exchanges recorded for the same controller,
+    or for any controller if any_controller is True (one recording fanned out
+    to a whole fleet). Repeated requests get their recorded responses in order,
+    starting over when exhausted. A latency_scale of 0 replays as fast as possible.
+    """
+    def __init__(self, path, latency_scale=1.0, any_controller=False):
+        self.latency_scale = latency_scale
+        self.any_controller = any_controller
+        self._exchanges = {}
+        self._positions = {}
+        self._lock = threading.Lock()
+
+        with gzip.open(path, "rb") as recording:
+            for line in recording:
+                exchange = json.loads(line)
+                # recordings made before controllers were recorded match any
+                controller = None if any_controller else exchange.get("controller")
+                self._exchanges.setdefault(
+                    (controller, _request_key(exchange["request"])), []
+                ).append(exchange)
+
+    def post(self, url, data=None, **kwargs):
+        """Same as requests.post, answered from the recording"""
+        request = _request_key(_redact(json.loads(data)))
+        key = (None, request) if self.any_controller else (_controller(url), request)
+
+        with self._lock:
+            if key not in self._exchanges:
+                key = (None, request)
+            exchanges = self._exchanges.get(key)
+            if not exchanges:
+                raise KeyError("Request not recorded: {0}".format(data))
+            position = self._positions.get(key, 0)
+            self._positions[key] = (position + 1) % len(exchanges)
+
+        exchange = exchanges[position]
+        if self.latency_scale:
+            time.sleep(exchange["latency"] * self.latency_scale)
+
+        return ReplayResponse(exchange["status"], exchange["response"])
@@ -0,0 +1,153 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Stub management endpoint answering canned responses, for benchmarks and load
+tests without a real controller. It does not check credentials.
+
+Usage: python stub.py [listen_port] [latency]
+"""
+
+import sys
+import json
+import time
+import BaseHTTPServer
+import SocketServer
+
+ROOT = {
+    "name": "stub",
+    "product-name": "WildFly Full",
+    "product-version": "10.1.0.Final",
+    "release-codename": "Kenny",
+    "release-version": "2.2.0.Final",
+    "launch-type": "STANDALONE",
+    "server-state": "running"
+}
+
+MEMORY = {
+    "heap-memory-usage": {
+        "init": 67108864, "used": 123456789, "committed": 268435456, "max": 536870912
+    },
+    "non-heap-memory-usage": {
+        "init": 2555904, "used": 98765432, "committed": 134217728, "max": -1
+    },
+    "object-name": "java.lang:type=Memory",
+    "object-pending-finalization-count": 0,
+    "verbose": False
+}
+
+DATASOURCES = {
+    "ExampleDS": {
+        "connection-url": "jdbc:h2:mem:test;DB_CLOSE_DELAY=-1",
+        "jndi-name": "java:jboss/datasources/ExampleDS",
+        "driver-class": None,
+        "driver-name": "h2",
+        "enabled": True,
+        "jta": True,
+        "max-pool-size": 20,
+        "min-pool-size": 0,
+        "user-name": "sa",
+        "statistics-enabled": True,
+        "statistics": {"pool": {
+            "ActiveCount": 2, "AvailableCount": 18, "CreatedCount": 2, "DestroyedCount": 0,
+            "InUseCount": 1, "MaxUsedCount": 2, "MaxWaitTime": 0
+        }}
+    }
+}
+
+def _flat_address(address):
+    if not address:
+        return []
+    if isinstance(address[0], dict):
+        return [part for element in address for item in element.items() for part in item]
+    return list(address)
+
+def respond(command):
+    """Returns the management response for command"""
+    operation = command.get("operation")
+    address = _flat_address(command.get("address"))
+
+    if operation == "composite":
+        steps = [respond(step) for step in command.get("steps", [])]
+        outcome = "success" if all(s["outcome"] == "success" for s in steps) else "failed"
+        response = {"outcome": outcome, "result": dict(
+            ("step-{0}".format(i + 1), step) for i, step in enumerate(steps)
+        )}
+        if outcome != "success":
+            response["failure-description"] = "Composite operation failed"
+        return response
+
+    if operation == "read-resource":
+        if address[-4:] == ["core-service", "platform-mbean", "type", "memory"]:
+            return {"outcome": "success", "result": MEMORY}
+        if not address:
+            return {"outcome": "success", "result": ROOT}
+
+    if operation == "read-attribute" and not address and command.get("name") in ROOT:
+        return {"outcome": "success", "result": ROOT[command["name"]]}
+
+    if operation == "read-children-resources":
+        result = DATASOURCES if command.get("child-type") == "data-source" else {}
+        return {"outcome": "success", "result": result}
+
+    if operation == "read-children-names":
+        return {"outcome": "success", "result": []}
+
+    return {
+        "outcome": "failed",
+        "failure-description": "WFLYCTL0031: No operation named '{0}' exists at address {1}"
+                               .format(operation, address)
+    }
+
+class StubRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers POST /management with canned responses after the server latency"""
+    protocol_version = "HTTP/1.1"
+    # headers and body are separate writes, Nagle would hold back the body
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.getheader("Content-Length", 0)))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        try:
+            response = respond(json.loads(body))
+        except ValueError:
+            response = {"outcome": "failed", "failure-description": "Invalid JSON"}
+
+        content = json.dumps(response)
+        self.send_response(200 if response["outcome"] == "success" else 500)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+class StubController(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Threaded stub management endpoint"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0):
+        BaseHTTPServer.HTTPServer.__init__(self, address, StubRequestHandler)
+        self.latency = latency
+
+    @property
+    def controller(self):
+        """host:port to give Jbosscli"""
+        return "{0}:{1}".format(*self.server_address)
+
+def main(argv):
+    port = int(argv[1]) if len(argv) > 1 else 9990
+    latency = float(argv[2]) if len(argv) > 2 else 0
+
+    server = StubController(("127.0.0.1", port), latency)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
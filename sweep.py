@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Fleet wide sweeps sharded across a process pool.
+
+Each worker process gets shards of the controllers and works through a shard
+with a pool of threads, so model building is spread over the cores while many
+latency bound requests stay in flight. Only the task's compact result is sent
+back:
+
+    results, errors = sweep([("host1:9990", "user:password"), ...], summarize)
+
+Tasks and cli factories must be picklable, i.e. module level functions.
+"""
+
+import multiprocessing
+
+from jbosscli import Jbosscli
+from jbosscli import _run_concurrently
+
+def summarize(cli):
+    """Default sweep task: a compact, picklable summary of the controller"""
+    return {
+        "name": cli.name,
+        "product-version": cli.product_version,
+        "hosts": [
+            (host.name, host.status, [
+                (i.name, i.server_group_name, i.status) for i in host.instances
+            ])
+            for host in cli.hosts
+        ],
+        "deployments": [
+            (d.name, d.runtime_name, d.enabled) for d in cli.deployments
+        ],
+        "server-groups": [
+            (group.name, group.profile, [d.name for d in group.deployments])
+            for group in getattr(cli, "server_groups", [])
+        ]
+    }
+
+def _sweep_shard(job):
+    cli_factory, task, shard, threads = job
+    outcomes = []
+    for (controller, _), result, error in _run_concurrently(
+            lambda target: task(cli_factory(*target)), shard, threads):
+        # exceptions do not always pickle, send their description instead
+        error = None if error is None else "{0}: {1}".format(type(error).__name__, error)
+        outcomes.append((controller, result, error))
+    return outcomes
+
+def sweep(controllers, task=summarize, processes=None, cli_factory=Jbosscli, chunksize=None,
+          threads=16):
+    """
+    Runs task on a Jbosscli for each (controller, auth) in controllers using a
+    pool of processes (one per core by default), each sweeping shards of
+    chunksize controllers with up to threads at once.
+    Returns a map of controller to result and a map of controller to error.
+    """
+    controllers = list(controllers)
+    processes = processes or multiprocessing.cpu_count()
+    if chunksize is None:
+        # two shards per process evens out slow shards without starving the threads
+        chunksize = max(1, -(-len(controllers) // (processes * 2)))
+
+    jobs = [
+        (cli_factory, task, controllers[start:start + chunksize], threads)
+        for start in range(0, len(controllers), chunksize)
+    ]
+
+    results = {}
+    errors = {}
+    pool = multiprocessing.Pool(processes)
+    try:
+        for outcomes in pool.imap_unordered(_sweep_shard, jobs):
+            for controller, result, error in outcomes:
+                if error is not None:
+                    errors[controller] = error
+                else:
+                    results[controller] = result
+    finally:
+        pool.close()
+        pool.join()
+
+    return results, errors
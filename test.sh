@@ -12,7 +12,7 @@ fi
 rm -f .coverage
 
 #for f in `git ls-files $TEST_PATTERN | sed 's/\//\./g' | sed 's/\.py//g'`; do
-for f in `git ls-files test_jbosscli.py | sed 's/\//\./g' | sed 's/\.py//g'`; do
+for f in `git ls-files test_jbosscli.py test_proxy.py test_replay.py test_sweep.py test_exporter.py test_cli.py test_loadgen.py | sed 's/\//\./g' | sed 's/\.py//g'`; do
   echo "-- $f"
   python -m coverage run --omit=$TEST_PATTERN,$INIT_PATTERN -a -m $f
 done
@@ -0,0 +1,65 @@
+#!/usr/bin/python
+
+import sys
+import json
+import unittest
+import threading
+import StringIO
+
+import cli
+from stub import StubController
+
+class TestCommandLine(unittest.TestCase):
+    """
+        Tests for the command line, against the stub controller
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = StubController()
+        thread = threading.Thread(target=cls.stub.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.shutdown()
+        cls.stub.server_close()
+
+    def _run(self, *argv):
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = StringIO.StringIO(), StringIO.StringIO()
+        try:
+            status = cli.main(["-c", self.stub.controller, "-u", "a:b"] + list(argv))
+            return status, sys.stdout.getvalue(), sys.stderr.getvalue()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+    def test_raw_should_print_result_as_json(self):
+        status, out, _ = self._run("raw", '{"operation": "read-attribute", "name": "name"}')
+
+        self.assertEqual(status, 0)
+        self.assertEqual(json.loads(out), "stub")
+
+    def test_info_should_print_controller_attributes(self):
+        status, out, _ = self._run("info")
+
+        self.assertEqual(status, 0)
+        self.assertTrue("product-version\t10.1.0.Final\n" in out)
+        self.assertTrue("launch-type\tSTANDALONE\n" in out)
+
+    def test_failures_should_be_reported_on_stderr(self):
+        status, out, err = self._run("raw", '{"operation": "shutdown"}')
+
+        self.assertEqual(status, 1)
+        self.assertEqual(out, "")
+        self.assertTrue("No operation named 'shutdown'" in err)
+
+    def test_parse_where(self):
+        self.assertEqual(
+            cli._parse_where(["status=STOPPED", "enabled=False"]),
+            {"status": "STOPPED", "enabled": False}
+        )
+
+if __name__ == '__main__':
+    unittest.main()
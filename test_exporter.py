@@ -0,0 +1,151 @@
+#!/usr/bin/python
+
+import unittest
+from mock import MagicMock
+
+from jbosscli import CliError
+from jbosscli import Instance
+from exporter import MetricsCollector
+
+MEMORY = {
+    "heap-memory-usage": {"init": 1, "used": 100, "committed": 200, "max": 400},
+    "non-heap-memory-usage": {"init": 1, "used": 10, "committed": 20, "max": -1}
+}
+
+DATASOURCES = {
+    "ExampleDS": {
+        "connection-url": "jdbc:h2:mem:test",
+        "jndi-name": "java:/ExampleDS",
+        "driver-class": None,
+        "driver-name": "h2",
+        "enabled": True,
+        "jta": True,
+        "max-pool-size": 20,
+        "min-pool-size": 0,
+        "user-name": "sa",
+        "statistics-enabled": True,
+        "statistics": {"pool": {
+            "ActiveCount": 3, "AvailableCount": 17, "CreatedCount": 3, "DestroyedCount": 0,
+            "InUseCount": 2, "MaxUsedCount": 5, "MaxWaitTime": 7
+        }}
+    }
+}
+
+class Struct(object):
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+class TestMetricsCollector(unittest.TestCase):
+    """
+        Tests for the metrics exporter collector
+    """
+
+    def _cli(self):
+        cli = Struct(domain=True, composite=MagicMock())
+        host = Struct(name="h1", controller=cli)
+        host.instances = [
+            Instance({"name": "s1", "group": "g1", "status": "STARTED"}, host),
+            Instance({"name": "s2", "group": "g1", "status": "STARTED"}, host),
+            Instance({"name": "s3", "group": "g1", "status": "STOPPED"}, host)
+        ]
+        cli.hosts = [host]
+        return cli
+
+    def test_collect_should_batch_reads_of_running_instances(self):
+        cli = self._cli()
+        cli.composite.side_effect = lambda steps: [
+            MEMORY if step["operation"] == "read-resource" else DATASOURCES
+            for step in steps
+        ]
+        collector = MetricsCollector(cli, batch_size=3)
+
+        text = collector.collect()
+
+        self.assertEqual([len(c[0][0]) for c in cli.composite.call_args_list], [3, 1])
+        self.assertTrue('jbosscli_heap_used_bytes{host="h1",server="s1"} 100\n' in text)
+        self.assertTrue('jbosscli_up{host="h1",server="s2"} 1\n' in text)
+        self.assertTrue(
+            'jbosscli_datasource_in_use_connections'
+            '{datasource="ExampleDS",host="h1",server="s2"} 2\n' in text
+        )
+        self.assertFalse('server="s3"' in text)
+        self.assertEqual(collector.latest, text)
+
+    def test_failed_steps_should_mark_server_down(self):
+        cli = self._cli()
+        cli.composite.side_effect = CliError("failed", {
+            "outcome": "failed",
+            "result": {
+                "step-1": {"outcome": "success", "result": MEMORY},
+                "step-2": {"outcome": "success", "result": {}},
+                "step-3": {"outcome": "failed", "failure-description": "down"},
+                "step-4": {"outcome": "failed", "failure-description": "down"}
+            }
+        })
+        cli.invoke_cli = MagicMock(side_effect=CliError("down"))
+
+        text = MetricsCollector(cli).collect()
+
+        self.assertEqual(cli.invoke_cli.call_count, 2)
+        self.assertTrue('jbosscli_up{host="h1",server="s1"} 1\n' in text)
+        self.assertTrue('jbosscli_up{host="h1",server="s2"} 0\n' in text)
+        self.assertFalse('jbosscli_heap_used_bytes{host="h1",server="s2"}' in text)
+
+    def test_steps_cancelled_by_a_failed_batch_should_be_retried(self):
+        cli = self._cli()
+        cli.hosts[0].instances[2].status = "STARTED"
+        cli.composite.side_effect = CliError("failed", {
+            "outcome": "failed",
+            "rolled-back": True,
+            "result": {
+                "step-1": {"outcome": "success", "result": MEMORY},
+                "step-2": {"outcome": "success", "result": {}},
+                "step-3": {"outcome": "failed", "failure-description": "down"},
+                "step-4": {"outcome": "cancelled"},
+                "step-5": {"outcome": "cancelled"},
+                "step-6": {"outcome": "cancelled"}
+            }
+        })
+
+        def invoke_cli(step):
+            if "s2" in step["address"]:
+                raise CliError("down")
+            return MEMORY if step["operation"] == "read-resource" else DATASOURCES
+        cli.invoke_cli = MagicMock(side_effect=invoke_cli)
+
+        text = MetricsCollector(cli).collect()
+
+        self.assertEqual(cli.invoke_cli.call_count, 4)
+        self.assertTrue('jbosscli_up{host="h1",server="s1"} 1\n' in text)
+        self.assertTrue('jbosscli_up{host="h1",server="s2"} 0\n' in text)
+        self.assertTrue('jbosscli_up{host="h1",server="s3"} 1\n' in text)
+        self.assertTrue('jbosscli_heap_used_bytes{host="h1",server="s3"} 100\n' in text)
+
+    def test_status_should_be_refreshed_every_few_collections(self):
+        cli = self._cli()
+        cli.composite.side_effect = lambda steps: [MEMORY, {}] * (len(steps) // 2)
+        started = cli.hosts[0].instances[2]
+        cli.refresh_status = MagicMock(side_effect=lambda: setattr(started, "status", "STARTED"))
+        collector = MetricsCollector(cli, status_every=2)
+
+        collector.collect()
+        second = collector.collect()
+        third = collector.collect()
+
+        self.assertEqual(cli.refresh_status.call_count, 1)
+        self.assertFalse('server="s3"' in second)
+        self.assertTrue('jbosscli_up{host="h1",server="s3"} 1\n' in third)
+
+    def test_standalone_should_read_root_resources(self):
+        cli = Struct(domain=False, composite=MagicMock(return_value=[MEMORY, {}]))
+
+        text = MetricsCollector(cli).collect()
+
+        self.assertEqual(
+            cli.composite.call_args[0][0][0]["address"],
+            ["core-service", "platform-mbean", "type", "memory"]
+        )
+        self.assertTrue("jbosscli_heap_max_bytes 400\n" in text)
+
+if __name__ == '__main__':
+    unittest.main()
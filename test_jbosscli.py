@@ -1,5 +1,11 @@
 #!/usr/bin/python
 
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
 import unittest
 from mock import MagicMock
 from mock import patch
@@ -104,6 +110,25 @@ class TestJbosscli(unittest.TestCase):
         server_error = cm.exception
         self.assertEqual(server_error.msg, "Error requesting: OMG code")
 
+    @patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock())
+    def test_invoke_raw_should_return_full_responses(self):
+        responses = [
+            {
+                "outcome": "success",
+                "result": None,
+                "response-headers": {"operation-requires-reload": True}
+            },
+            {"outcome": "failed", "failure-description": "nope", "rolled-back": True}
+        ]
+        post = MagicMock(side_effect=[
+            Struct(status_code=200, text=None, json=MagicMock(return_value=r)) for r in responses
+        ])
+
+        with patch("jbosscli.requests.post", post):
+            cli = Jbosscli("", "a:b")
+            self.assertEqual(cli.invoke_raw({"operation": "reload"}), responses[0])
+            self.assertEqual(cli.invoke_raw({"operation": "reload"}), responses[1])
+
     def test_fetch_controller_data_standalone(self):
         cli_response = {
             "name": "a name for the server",
@@ -183,5 +208,1136 @@ class TestJbosscli(unittest.TestCase):
             cli._fetch_host_data.assert_called_once_with()
             cli._fetch_server_group_data.assert_called_once_with()
 
+class TestCodecs(unittest.TestCase):
+    """
+        Tests for the pluggable JSON codecs and prepared operations
+    """
+
+    def test_get_codec_default_is_stdlib(self):
+        self.assertEqual(jbosscli.get_codec().name, "json")
+
+    def test_get_codec_fastest_is_first_available(self):
+        self.assertEqual(jbosscli.get_codec("fastest").name, jbosscli.available_codecs()[0])
+
+    def test_get_codec_unknown_should_raise_ValueError(self):
+        with self.assertRaises(ValueError):
+            jbosscli.get_codec("nonexistent")
+
+    def test_prepared_operation_render_should_prepend_address(self):
+        operation = jbosscli.PreparedOperation({
+            "operation": "read-resource",
+            "include-runtime": "true",
+            "address": ["core-service", "platform-mbean"]
+        })
+
+        payload = json.loads(operation.render(["host", "h1", "server", "s1"]))
+
+        self.assertEqual(payload, {
+            "operation": "read-resource",
+            "include-runtime": "true",
+            "address": ["host", "h1", "server", "s1", "core-service", "platform-mbean"]
+        })
+        self.assertEqual(
+            json.loads(operation.render())["address"],
+            ["core-service", "platform-mbean"]
+        )
+
+    @patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock())
+    def test_read_memory_status_should_send_prepared_payload(self):
+        cli = Jbosscli("h:p", "u:p")
+        cli.invoke_cli = MagicMock(return_value={})
+        host = jbosscli.Host({
+            "name": "h1",
+            "product-name": "a product name",
+            "product-version": "1.2.3",
+            "release-codename": "Batman",
+            "release-version": "3.2.1GA",
+            "master": True
+        }, controller=cli)
+        instance = Struct(name="s1")
+
+        host.read_memory_status(instance)
+
+        payload = json.loads(cli.invoke_cli.call_args[0][0])
+        self.assertEqual(
+            payload["address"],
+            ["host", "h1", "server", "s1", "core-service", "platform-mbean", "type", "memory"]
+        )
+
+class TestProjection(unittest.TestCase):
+    """
+        Tests for the projected model loaders
+    """
+
+    @patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock())
+    def test_composite_should_return_step_results_in_order(self):
+        cli = Jbosscli("h:p", "u:p")
+        cli.invoke_cli = MagicMock(return_value={
+            "step-1": {"outcome": "success", "result": "a"},
+            "step-2": {"outcome": "success", "result": "b"}
+        })
+
+        self.assertEqual(cli.composite([{}, {}]), ["a", "b"])
+
+    @patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock())
+    def test_read_projection_should_keep_only_requested_attributes(self):
+        cli = Jbosscli("h:p", "u:p")
+        cli.invoke_cli = MagicMock(return_value=[
+            {
+                "address": [{"host": "h1"}],
+                "outcome": "success",
+                "result": {"name": "h1", "host-state": "running", "other": 1}
+            }
+        ])
+
+        result = cli.read_projection(["name", "host-state"], ["host", "*"])
+
+        self.assertEqual(result, [([{"host": "h1"}], {"name": "h1", "host-state": "running"})])
+        self.assertTrue(cli.invoke_cli.call_args[0][0]["attributes-only"])
+
+    def test_projected_standalone_load(self):
+        composite_result = {
+            "step-1": {"outcome": "success", "result": {
+                "name": "a name for the server",
+                "product-name": "a product name",
+                "product-version": "1.2.3",
+                "release-codename": "Batman",
+                "release-version": "3.2.1GA",
+                "launch-type": "STANDALONE",
+                "unused": "dropped"
+            }},
+            "step-2": {"outcome": "success", "result": {
+                "some.property": {"value": "someValue!"}
+            }},
+            "step-3": {"outcome": "success", "result": {
+                "app.war": {"name": "app.war", "runtime-name": "app.war", "enabled": True}
+            }}
+        }
+
+        with patch("jbosscli.Jbosscli.invoke_cli", MagicMock(return_value=composite_result)):
+            cli = Jbosscli("h:p", "u:p", projection=True)
+
+        self.assertEqual(cli.product_version, "1.2.3")
+        self.assertEqual(len(cli.system_properties), 1)
+        self.assertEqual(cli.deployments[0].name, "app.war")
+        self.assertEqual(cli.hosts[0].name, "a name for the server - Standalone")
+
+    @patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock())
+    def test_projected_host_load(self):
+        cli = Jbosscli("h:p", "u:p", projection=True)
+        cli.hosts = []
+        cli.composite = MagicMock(return_value=[
+            [{
+                "address": [{"host": "h1"}],
+                "outcome": "success",
+                "result": {
+                    "name": "h1",
+                    "product-name": "a product name",
+                    "product-version": "1.2.3",
+                    "release-codename": "Batman",
+                    "release-version": "3.2.1GA",
+                    "master": False,
+                    "host-state": "running"
+                }
+            }],
+            [{
+                "address": [{"host": "h1"}, {"server-config": "s1"}],
+                "outcome": "success",
+                "result": {"name": "s1", "group": "g1", "status": "STARTED", "auto-start": True}
+            }]
+        ])
+
+        cli._fetch_host_data()
+
+        self.assertEqual(len(cli.hosts), 1)
+        self.assertEqual(cli.hosts[0].status, "running")
+        self.assertEqual(repr(cli.hosts[0].instances), "[Instance('s1', 'g1')]")
+
+class TestQuery(unittest.TestCase):
+    """
+        Tests for server side filtered queries
+    """
+
+    def _domain_cli(self):
+        with patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock()):
+            cli = Jbosscli("h:p", "u:p")
+        cli.domain = True
+        cli.hosts = [Struct(name="h1", master=False, instances=[])]
+        cli.server_groups = []
+        return cli
+
+    def test_find_instances_should_push_filter_to_query(self):
+        cli = self._domain_cli()
+        cli.invoke_cli = MagicMock(return_value=[
+            {
+                "address": [{"host": "h1"}, {"server-config": "s1"}],
+                "outcome": "success",
+                "result": {"name": "s1", "group": "g1", "status": "STOPPED"}
+            },
+            {
+                "address": [{"host": "h1"}, {"server-config": "s2"}],
+                "outcome": "success",
+                "result": None
+            }
+        ])
+
+        instances = cli.find_instances({"status": "STOPPED"})
+
+        command = cli.invoke_cli.call_args[0][0]
+        self.assertEqual(command["operation"], "query")
+        self.assertEqual(command["where"], {"status": "STOPPED"})
+        self.assertEqual([i.name for i in instances], ["s1"])
+        self.assertEqual(instances[0].host.name, "h1")
+
+    def test_query_unsupported_should_filter_on_client(self):
+        cli = self._domain_cli()
+        cli.server_groups = [Struct(name="g1", profile="full")]
+        cli.invoke_cli = MagicMock(side_effect=[
+            CliError("WFLYCTL0031: No operation named 'query' exists at address []"),
+            [
+                {
+                    "address": [{"server-group": "g1"}, {"deployment": "a.war"}],
+                    "outcome": "success",
+                    "result": {"name": "a.war", "runtime-name": "a.war", "enabled": False}
+                },
+                {
+                    "address": [{"server-group": "g1"}, {"deployment": "b.war"}],
+                    "outcome": "success",
+                    "result": {"name": "b.war", "runtime-name": "b.war", "enabled": True}
+                }
+            ]
+        ])
+
+        deployments = cli.find_deployments({"enabled": False})
+
+        self.assertEqual([d.name for d in deployments], ["a.war"])
+        self.assertEqual(deployments[0].server_group.name, "g1")
+        self.assertFalse(cli._query_supported)
+
+    def test_find_instances_without_model_should_read_hosts_only(self):
+        cli = Jbosscli("h:p", "u:p", fetch_model=False)
+        cli.invoke_cli = MagicMock(side_effect=[
+            [{
+                "address": [{"host": "h1"}, {"server-config": "s1"}],
+                "outcome": "success",
+                "result": {"name": "s1", "group": "g1", "status": "STOPPED"}
+            }],
+            [{
+                "address": [{"host": "h1"}],
+                "outcome": "success",
+                "result": {
+                    "product-name": "WildFly", "product-version": "10.1.0.Final",
+                    "release-codename": "Kenny", "release-version": "2.2.0.Final",
+                    "master": False, "host-state": "running"
+                }
+            }]
+        ])
+
+        instances = cli.find_instances({"status": "STOPPED"})
+
+        self.assertEqual(cli.invoke_cli.call_count, 2)
+        self.assertEqual(cli.invoke_cli.call_args[0][0]["address"], ["host", "*"])
+        self.assertEqual(instances[0].host.name, "h1")
+        self.assertEqual(instances[0].host.instances, instances)
+
+    def test_find_deployments_without_model_should_read_launch_type(self):
+        cli = Jbosscli("h:p", "u:p", fetch_model=False)
+        cli.invoke_cli = MagicMock(side_effect=[
+            "DOMAIN",
+            [{
+                "address": [{"server-group": "g1"}, {"deployment": "a.war"}],
+                "outcome": "success",
+                "result": {"name": "a.war", "runtime-name": "a.war", "enabled": True}
+            }],
+            [{
+                "address": [{"server-group": "g1"}],
+                "outcome": "success",
+                "result": {
+                    "profile": "full", "socket-binding-group": "full-sockets",
+                    "socket-binding-port-offset": 0
+                }
+            }]
+        ])
+
+        deployments = cli.find_deployments()
+
+        self.assertEqual(cli.invoke_cli.call_args_list[0][0][0]["name"], "launch-type")
+        self.assertEqual(deployments[0].server_group.name, "g1")
+        self.assertEqual(deployments[0].server_group.profile, "full")
+
+    def test_query_other_errors_should_raise(self):
+        cli = self._domain_cli()
+        cli.invoke_cli = MagicMock(side_effect=CliError("Unknown attribute"))
+
+        with self.assertRaises(CliError):
+            cli.query(["host", "*"], {"bogus": 1})
+
+class TestCoalescing(unittest.TestCase):
+    """
+        Tests for the single flight deduplication of concurrent reads
+    """
+
+    def _start(self, cli, command, count):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cli.invoke_cli(command)))
+            for _ in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        return threads, results
+
+    def _wait_for(self, condition):
+        for _ in range(500):
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail("timed out")
+
+    @patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock())
+    def test_concurrent_identical_reads_should_share_one_request(self):
+        cli = Jbosscli("h:p", "u:p")
+        release = threading.Event()
+        calls = []
+
+        def post(data, timeout=None):
+            calls.append(data)
+            release.wait()
+            return {"value": 1}
+
+        cli._post = post
+        threads, results = self._start(cli, {"operation": "read-resource"}, 5)
+
+        self._wait_for(lambda: cli.coalesced_calls == 4)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"value": 1}] * 5)
+        self.assertEqual(cli._inflight, {})
+
+    @patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock())
+    def test_reads_after_a_write_should_not_join_earlier_reads(self):
+        cli = Jbosscli("h:p", "u:p")
+        release = threading.Event()
+        value = ["old"]
+
+        def post(data, timeout=None):
+            command = json.loads(data)
+            if command["operation"] == "write-attribute":
+                value[0] = command["value"]
+                return None
+            current = value[0]
+            if current == "old":
+                release.wait()
+            return current
+
+        cli._post = post
+        read = {"operation": "read-attribute", "name": "x"}
+        threads, results = self._start(cli, read, 1)
+        self._wait_for(lambda: cli._inflight)
+
+        cli.invoke_cli({"operation": "write-attribute", "name": "x", "value": "new"})
+        reader, after_write = self._start(cli, read, 1)
+        reader[0].join(5)
+        release.set()
+        threads[0].join()
+
+        self.assertEqual(after_write, ["new"])
+        self.assertEqual(results, ["old"])
+        self.assertEqual(cli.coalesced_calls, 0)
+
+    @patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock())
+    def test_writes_should_not_be_coalesced(self):
+        cli = Jbosscli("h:p", "u:p")
+        cli._post = MagicMock(return_value=None)
+
+        cli.invoke_cli({"operation": "reload"})
+        cli.invoke_cli({"operation": "reload"})
+
+        self.assertEqual(cli._post.call_count, 2)
+        self.assertEqual(cli.coalesced_calls, 0)
+
+    @patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock())
+    def test_coalesced_callers_should_receive_the_error(self):
+        cli = Jbosscli("h:p", "u:p")
+        release = threading.Event()
+        errors = []
+
+        def post(data, timeout=None):
+            release.wait()
+            raise ServerError("down")
+
+        def read():
+            try:
+                cli.invoke_cli({"operation": "read-resource"})
+            except ServerError as ex:
+                errors.append(ex)
+
+        cli._post = post
+        threads = [threading.Thread(target=read) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+
+        self._wait_for(lambda: cli.coalesced_calls == 2)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(errors), 3)
+
+    def test_prepared_payload_is_read_only(self):
+        self.assertTrue(jbosscli._MEMORY_STATUS.render().read_only)
+
+def _thread(name, state, *methods):
+    return {
+        "thread-name": name,
+        "thread-state": state,
+        "stack-trace": [
+            {"class-name": "a.B", "method-name": m, "file-name": "B.java", "line-number": 1}
+            for m in methods
+        ]
+    }
+
+class TestThreadDumps(unittest.TestCase):
+    """
+        Tests for concurrent thread dump capture and aggregation
+    """
+
+    def _instances(self, responses):
+        controller = Struct(invoke_cli=MagicMock(side_effect=lambda c: responses[c["address"][3]]))
+        host = Struct(name="h1", controller=controller)
+        return [
+            jbosscli.Instance({"name": name, "group": "g1", "status": "STARTED"}, host)
+            for name in sorted(responses.keys())
+        ]
+
+    def test_read_thread_dump_should_format_frames(self):
+        instance = self._instances({"s1": [_thread("main", "RUNNABLE", "run", "loop")]})[0]
+
+        dump = instance.read_thread_dump()
+
+        command = instance.host.controller.invoke_cli.call_args[0][0]
+        self.assertEqual(command["operation"], "dump-all-threads")
+        self.assertEqual(command["address"][-2:], ["type", "threading"])
+        self.assertEqual(
+            dump.threads,
+            [("main", "RUNNABLE", ("a.B.run(B.java:1)", "a.B.loop(B.java:1)"))]
+        )
+
+    def test_capture_and_aggregate_should_rank_identical_stacks(self):
+        instances = self._instances({
+            "s1": [_thread("t1", "BLOCKED", "lock"), _thread("t2", "BLOCKED", "lock")],
+            "s2": [_thread("t1", "BLOCKED", "lock"), _thread("t2", "RUNNABLE", "run")]
+        })
+
+        dumps, errors = jbosscli.capture_thread_dumps(instances)
+        summaries = jbosscli.aggregate_stacks(dumps)
+
+        self.assertEqual(errors, {})
+        self.assertEqual([s.count for s in summaries], [3, 1])
+        self.assertEqual(summaries[0].states, {"BLOCKED": 3})
+        self.assertEqual(len(summaries[0].instances), 2)
+        self.assertTrue(dumps[0].threads[0][2] is dumps[1].threads[0][2])
+
+    def test_capture_should_report_failed_instances(self):
+        instances = self._instances({"s1": [_thread("t1", "RUNNABLE", "run")]})
+        instances[0].host.controller.invoke_cli.side_effect = ServerError("down")
+
+        dumps, errors = jbosscli.capture_thread_dumps(instances)
+
+        self.assertEqual(dumps, [])
+        self.assertEqual(errors.keys(), instances)
+
+    def test_capture_should_format_non_ascii_frames(self):
+        thread = _thread("t1", "RUNNABLE", "run")
+        thread["stack-trace"][0].update({"class-name": u"com.acme.Caf\xe9", "file-name": u"Caf\xe9.java"})
+        instances = self._instances({"s1": [thread]})
+
+        dumps, errors = jbosscli.capture_thread_dumps(instances)
+
+        self.assertEqual(errors, {})
+        self.assertEqual(
+            dumps[0].threads[0][2],
+            (u"com.acme.Caf\xe9.run(Caf\xe9.java:1)".encode("utf-8"),)
+        )
+
+def _datasource(name, enabled=True, in_use=None, max_pool_size=20):
+    data = {
+        "connection-url": "jdbc:h2:mem:test",
+        "jndi-name": "java:/" + name,
+        "driver-class": None,
+        "driver-name": "h2",
+        "enabled": enabled,
+        "jta": True,
+        "max-pool-size": max_pool_size,
+        "min-pool-size": 0,
+        "user-name": "sa"
+    }
+    if in_use is not None:
+        data["statistics-enabled"] = True
+        data["statistics"] = {"pool": {
+            "ActiveCount": in_use, "AvailableCount": 1, "CreatedCount": 1,
+            "DestroyedCount": 0, "InUseCount": in_use, "MaxUsedCount": in_use,
+            "MaxWaitTime": 5
+        }}
+    return data
+
+class TestDataSourceHealth(unittest.TestCase):
+    """
+        Tests for the concurrent datasource health check
+    """
+
+    def test_check_datasources_should_test_enabled_datasources_of_running_instances(self):
+        def invoke_cli(command, timeout=None):
+            if command["operation"] == "read-children-resources":
+                return {
+                    "busy": _datasource("busy", in_use=18),
+                    "idle": _datasource("idle", in_use=2),
+                    "nostats": _datasource("nostats"),
+                    "off": _datasource("off", enabled=False)
+                }
+            if command["address"][-1] == "idle":
+                raise CliError("Connection refused")
+            self.assertEqual(timeout, 3)
+            return [True]
+
+        controller = Struct(invoke_cli=MagicMock(side_effect=invoke_cli))
+        host = Struct(name="h1", controller=controller)
+        running = jbosscli.Instance({"name": "s1", "group": "g1", "status": "STARTED"}, host)
+        stopped = jbosscli.Instance({"name": "s2", "group": "g1", "status": "STOPPED"}, host)
+
+        healths, errors = jbosscli.check_datasources([running, stopped], timeout=3)
+
+        self.assertEqual(errors, {})
+        self.assertEqual([h.datasource.name for h in healths], ["busy", "idle", "nostats"])
+        self.assertEqual(healths[0].saturation, 0.9)
+        self.assertTrue(healths[0].ok)
+        self.assertFalse(healths[1].ok)
+        self.assertEqual(healths[1].error.msg, "Connection refused")
+        self.assertEqual(healths[2].saturation, None)
+
+    def test_check_datasources_should_read_current_pool_usage(self):
+        in_use = [4, 16]
+
+        def invoke_cli(command, timeout=None):
+            if command["operation"] == "read-children-resources":
+                return {"ds": _datasource("ds", in_use=in_use.pop(0))}
+            return [True]
+
+        host = Struct(name="h1", controller=Struct(invoke_cli=MagicMock(side_effect=invoke_cli)))
+        instance = jbosscli.Instance({"name": "s1", "group": "g1", "status": "STARTED"}, host)
+
+        first, _ = jbosscli.check_datasources([instance])
+        second, _ = jbosscli.check_datasources([instance])
+
+        self.assertEqual(first[0].saturation, 0.2)
+        self.assertEqual(second[0].saturation, 0.8)
+        self.assertEqual(instance.datasources[0].in_use_connections, 16)
+
+    @patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock())
+    def test_refresh_status_should_update_instances(self):
+        cli = Jbosscli("h:p", "u:p")
+        cli.domain = True
+        host = Struct(name="h1", controller=cli, master=False)
+        host.instances = [
+            jbosscli.Instance({"name": "s1", "group": "g1", "status": "STOPPED"}, host),
+            jbosscli.Instance({"name": "s2", "group": "g1", "status": "STARTED"}, host)
+        ]
+        # servers of the master host are not part of the model
+        cli.hosts = [Struct(name="dc", controller=cli, master=True, instances=[]), host]
+        cli.invoke_cli = MagicMock(return_value=[
+            {
+                "address": [{"host": "dc"}, {"server-config": "s0"}],
+                "outcome": "success",
+                "result": "STARTED"
+            },
+            {
+                "address": [{"host": "h1"}, {"server-config": "s1"}],
+                "outcome": "success",
+                "result": "STARTED"
+            },
+            {
+                "address": [{"host": "h1"}, {"server-config": "s2"}],
+                "outcome": "success",
+                "result": "STOPPED"
+            }
+        ])
+
+        self.assertEqual([i.name for i in cli.get_instances(running=True)], ["s2"])
+        cli.refresh_status()
+
+        self.assertEqual([i.name for i in cli.get_instances(running=True)], ["s1"])
+        self.assertEqual(cli._fetch_controller_data.call_count, 1)
+
+    @patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock())
+    def test_refresh_status_should_reload_model_when_servers_change(self):
+        cli = Jbosscli("h:p", "u:p")
+        cli.domain = True
+        cli.hosts = [Struct(name="h1", master=False, instances=[])]
+        cli.invoke_cli = MagicMock(return_value=[{
+            "address": [{"host": "h1"}, {"server-config": "new"}],
+            "outcome": "success",
+            "result": "STARTED"
+        }])
+
+        cli.refresh_status()
+
+        self.assertEqual(cli._fetch_controller_data.call_count, 2)
+
+    @patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock())
+    def test_invoke_cli_should_pass_timeout(self):
+        cli = Jbosscli("h:p", "u:p", timeout=5)
+        cli._post = MagicMock(return_value=None)
+
+        cli.invoke_cli({"operation": "read-resource"})
+        cli.invoke_cli({"operation": "read-resource"}, timeout=1)
+
+        self.assertEqual([c[0][1] for c in cli._post.call_args_list], [5, 1])
+
+class TestSystemPropertySync(unittest.TestCase):
+    """
+        Tests for bulk system property compare and apply
+    """
+
+    def _cli(self):
+        with patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock()):
+            cli = Jbosscli("h:p", "u:p")
+        cli.system_properties = [
+            jbosscli.SystemProperty("same", {"value": "1"}),
+            jbosscli.SystemProperty("changed", {"value": "old", "boot-time": True}),
+            jbosscli.SystemProperty("gone", {"value": "x"})
+        ]
+        return cli
+
+    def test_diff_should_compute_adds_updates_and_removes(self):
+        changes = self._cli().diff_system_properties({
+            "same": "1",
+            "changed": "new",
+            "added": {"value": "a", "boot-time": False}
+        })
+
+        self.assertEqual([p.name for p in changes.added], ["added"])
+        self.assertEqual([p.name for p in changes.updated], ["changed"])
+        self.assertEqual([p.name for p in changes.removed], ["gone"])
+        self.assertEqual(changes.reload_required, ["changed"])
+
+    def test_diff_without_remove_should_keep_unlisted_properties(self):
+        changes = self._cli().diff_system_properties({"same": "1"}, remove=False)
+
+        self.assertEqual(len(changes), 0)
+
+    def test_apply_should_batch_writes_in_composites(self):
+        cli = self._cli()
+        cli.composite = MagicMock()
+
+        changes = cli.apply_system_properties({
+            "same": "1",
+            "changed": "new",
+            "a": "1",
+            "b": "2"
+        }, batch_size=2)
+
+        batches = [c[0][0] for c in cli.composite.call_args_list]
+        self.assertEqual([len(b) for b in batches], [2, 2])
+        self.assertEqual(
+            sorted(step["operation"] for batch in batches for step in batch),
+            ["add", "add", "remove", "write-attribute"]
+        )
+        self.assertEqual(len(changes), 4)
+        self.assertEqual(
+            sorted(str(p) for p in cli.system_properties),
+            ["a=1", "b=2", "changed=new", "same=1"]
+        )
+        self.assertTrue(
+            [p for p in cli.system_properties if p.name == "changed"][0].boot_time
+        )
+
+    def test_diff_should_write_boot_time_changes(self):
+        changes = self._cli().diff_system_properties({
+            "same": {"value": "1", "boot-time": True},
+            "changed": "old"
+        }, remove=False)
+
+        self.assertEqual([p.name for p in changes.updated], ["same"])
+        self.assertEqual(changes.reload_required, [])
+        self.assertEqual(changes.steps(), [{
+            "operation": "write-attribute",
+            "address": ["system-property", "same"],
+            "name": "boot-time",
+            "value": True
+        }])
+
+    def test_diff_should_compare_values_as_strings(self):
+        changes = self._cli().diff_system_properties({"same": 1, "port": 8080}, remove=False)
+
+        self.assertEqual([str(p) for p in changes.added], ["port=8080"])
+        self.assertEqual(changes.updated, [])
+
+    def test_failed_batch_should_keep_the_applied_ones(self):
+        cli = self._cli()
+        cli.composite = MagicMock(side_effect=[None, CliError("failed")])
+
+        with self.assertRaises(CliError):
+            cli.apply_system_properties({"a": "1", "b": "2", "c": "3"}, batch_size=2, remove=False)
+
+        applied = sorted(p.name for p in cli.system_properties)
+        self.assertEqual(len(applied), 5)
+        self.assertEqual(cli.composite.call_count, 2)
+
+class TestPaging(unittest.TestCase):
+    """
+        Tests for windowed reads of child collections
+    """
+
+    @patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock())
+    def test_iter_server_groups_should_read_in_windows(self):
+        cli = Jbosscli("h:p", "u:p")
+        cli.invoke_cli = MagicMock(return_value=["g1", "g2", "g3"])
+        cli.composite = MagicMock(side_effect=lambda steps: [
+            {
+                "profile": "full",
+                "socket-binding-group": "full-sockets",
+                "socket-binding-port-offset": 0
+            }
+            for _ in steps
+        ])
+
+        groups = cli.iter_server_groups(page_size=2)
+
+        self.assertEqual(cli.composite.call_count, 0)
+        self.assertEqual([g.name for g in groups], ["g1", "g2", "g3"])
+        windows = [c[0][0] for c in cli.composite.call_args_list]
+        self.assertEqual([len(w) for w in windows], [2, 1])
+        self.assertEqual(windows[1][0], {
+            "operation": "read-resource",
+            "address": ["server-group", "g3"],
+            "recursive": True
+        })
+
+    @patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock())
+    def test_paged_loader_should_use_iter_hosts(self):
+        cli = Jbosscli("h:p", "u:p", page_size=5)
+        cli.hosts = []
+        cli.iter_hosts = MagicMock(return_value=iter(["host"]))
+
+        cli._fetch_host_data()
+
+        cli.iter_hosts.assert_called_once_with(5)
+        self.assertEqual(cli.hosts, ["host"])
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    """
+        Tests for the adaptive concurrency limiter
+    """
+
+    def test_limit_should_grow_while_latency_is_stable(self):
+        limiter = jbosscli.AdaptiveLimiter(floor=1, ceiling=4)
+
+        for _ in range(20):
+            limiter.acquire()
+            limiter.release(0.1)
+
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_limit_should_back_off_on_errors_and_slow_responses(self):
+        limiter = jbosscli.AdaptiveLimiter(floor=2, ceiling=32, initial=16)
+
+        limiter.acquire()
+        limiter.release(0.1)
+        limiter.acquire()
+        limiter.release(0.1, failed=True)
+        self.assertTrue(limiter.limit < 10)
+
+        limiter._decreased_at = 0
+        limiter.acquire()
+        limiter.release(5)
+        self.assertTrue(limiter.limit < 5)
+
+        for _ in range(5):
+            limiter._decreased_at = 0
+            limiter.acquire()
+            limiter.release(5, failed=True)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_per_host_limiters(self):
+        limiter = jbosscli.AdaptiveLimiter()
+
+        self.assertTrue(limiter.for_host("h1") is limiter.for_host("h1"))
+        self.assertFalse(limiter.for_host("h1") is limiter.for_host("h2"))
+        self.assertEqual(jbosscli.AdaptiveLimiter(per_host=False).for_host("h1"), None)
+
+    @patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock())
+    def test_requests_should_go_through_controller_and_host_limiters(self):
+        limiter = jbosscli.AdaptiveLimiter()
+        cli = Jbosscli("h:p", "u:p", limiter=limiter)
+        cli._post = MagicMock(side_effect=ServerError("down"))
+
+        with self.assertRaises(ServerError):
+            cli.invoke_cli(jbosscli._MEMORY_STATUS.render(["host", "h1", "server", "s1"]))
+
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertEqual(limiter.for_host("h1").in_flight, 0)
+        self.assertTrue(limiter.for_host("h1").baseline is not None)
+        self.assertEqual(jbosscli._host_of({"address": [{"host": "h2"}]}), "h2")
+        self.assertEqual(jbosscli._host_of({"address": ["server-group", "g"]}), None)
+
+class TestModelCache(unittest.TestCase):
+    """
+        Tests for the on disk model cache
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.deployments = ["app.war"]
+        self.reads = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _post(self, data, timeout=None):
+        command = json.loads(data)
+        if command["operation"] == "composite":
+            return dict(
+                ("step-{0}".format(i + 1), {"outcome": "success", "result": self.deployments})
+                for i in range(len(command["steps"]))
+            )
+        self.reads += 1
+        return {
+            "name": "server{0}".format(self.reads),
+            "product-name": "a product name",
+            "product-version": "1.2.3",
+            "release-codename": "Batman",
+            "release-version": "3.2.1GA",
+            "launch-type": "STANDALONE"
+        }
+
+    def _load(self, max_age):
+        with patch("jbosscli.Jbosscli._post", MagicMock(side_effect=self._post)):
+            return Jbosscli("h:p", "u:p", model_cache=jbosscli.ModelCache(self.directory, max_age))
+
+    def test_fresh_model_should_be_reused(self):
+        first = self._load(60)
+        second = self._load(60)
+
+        self.assertEqual(self.reads, 1)
+        self.assertEqual(second.name, first.name)
+        self.assertEqual(second.model_cache.hits, 1)
+
+    def test_stale_model_should_be_revalidated_by_fingerprint(self):
+        self._load(0)
+        second = self._load(0)
+
+        self.assertEqual(self.reads, 1)
+        self.assertEqual(second.model_cache.revalidations, 1)
+
+        self.deployments = ["app.war", "other.war"]
+        third = self._load(0)
+
+        self.assertEqual(self.reads, 2)
+        self.assertEqual(third.name, "server2")
+        self.assertEqual(third.model_cache.misses, 1)
+
+    def test_other_loader_options_should_not_share_entries(self):
+        self._load(60)
+        with patch("jbosscli.Jbosscli._post", MagicMock(side_effect=self._post)):
+            Jbosscli("h:p", "u:p", page_size=5, model_cache=jbosscli.ModelCache(self.directory))
+
+        self.assertEqual(self.reads, 2)
+
+    def test_cache_should_be_shared_across_codecs(self):
+        class CompactCodec(jbosscli.JsonCodec):
+            def dumps(self, obj):
+                return json.dumps(obj, separators=(",", ":"))
+
+        self._load(60)
+        with patch("jbosscli.Jbosscli._post", MagicMock(side_effect=self._post)):
+            cli = Jbosscli(
+                "h:p", "u:p", codec=CompactCodec(),
+                model_cache=jbosscli.ModelCache(self.directory)
+            )
+
+        self.assertEqual(self.reads, 1)
+        self.assertEqual(cli.model_cache.hits, 1)
+
+    def test_other_threads_should_bypass_a_model_load(self):
+        other = []
+        fetch = Jbosscli._fetch_controller_data
+
+        def fetch_while_other_thread_reads(cli):
+            thread = threading.Thread(target=lambda: other.append(
+                cli.invoke_cli({"operation": "read-attribute", "name": "other"})
+            ))
+            thread.start()
+            thread.join()
+            fetch(cli)
+
+        with patch("jbosscli.Jbosscli._fetch_controller_data", fetch_while_other_thread_reads):
+            self._load(60)
+        [entry] = [
+            json.load(open(os.path.join(self.directory, name)))
+            for name in os.listdir(self.directory) if name.endswith(".json")
+        ]
+
+        self.assertEqual(len(other), 1)
+        self.assertFalse(any('"other"' in key for key in entry["responses"]))
+
+    def test_other_users_should_not_share_entries(self):
+        self._load(60)
+        with patch("jbosscli.Jbosscli._post", MagicMock(side_effect=self._post)):
+            other = Jbosscli("h:p", "monitor:p", model_cache=jbosscli.ModelCache(self.directory))
+
+        self.assertEqual(self.reads, 2)
+        self.assertEqual(other.name, "server2")
+
+class FakeLog(object):
+    """A log file answering read-log-file like the logging subsystem"""
+    def __init__(self, lines, legacy=False):
+        self.lines = lines
+        self.legacy = legacy
+        self.reads = []
+        self.failure = None
+
+    def invoke_cli(self, command):
+        if self.failure is not None:
+            raise CliError(self.failure)
+        if self.legacy and "log-file" in command["address"]:
+            raise CliError("WFLYCTL0216: Management resource not found")
+        self.reads.append((command["skip"], command["lines"]))
+        return self.lines[command["skip"]:command["skip"] + command["lines"]]
+
+class TestLogTail(unittest.TestCase):
+    """
+        Tests for incremental log tailing
+    """
+
+    def test_poll_should_start_with_backlog_and_return_only_new_lines(self):
+        log = FakeLog(["line {0}".format(i) for i in range(3000)])
+        tail = jbosscli.LogTail(log, ["host", "h1", "server", "s1"], backlog=2)
+
+        self.assertEqual(tail.poll(), ["line 2998", "line 2999"])
+        self.assertEqual(tail.poll(), [])
+
+        log.lines.extend(["new 1", "new 2"])
+        log.reads = []
+        self.assertEqual(tail.poll(), ["new 1", "new 2"])
+        self.assertEqual(log.reads, [(3000, 500)])
+
+    def test_poll_should_page_through_large_appends(self):
+        log = FakeLog([])
+        tail = jbosscli.LogTail(log, [], backlog=0, page_size=2)
+        tail.poll()
+
+        log.lines.extend(["a", "b", "c"])
+
+        self.assertEqual(tail.poll(), ["a", "b", "c"])
+
+    def test_rotated_log_should_be_read_from_start(self):
+        log = FakeLog(["old 1", "old 2"])
+        tail = jbosscli.LogTail(log, [], backlog=0)
+        tail.poll()
+
+        log.lines = ["rotated"]
+
+        self.assertEqual(tail.poll(), ["rotated"])
+
+    def test_legacy_servers_should_use_logging_subsystem_operation(self):
+        log = FakeLog(["a"], legacy=True)
+        tail = jbosscli.LogTail(log, ["host", "h1", "server", "s1"])
+
+        self.assertEqual(tail.poll(), ["a"])
+        self.assertTrue(tail._legacy)
+
+    def test_transient_errors_should_not_switch_to_legacy_operation(self):
+        log = FakeLog(["a"])
+        tail = jbosscli.LogTail(log, [])
+
+        log.failure = "WFLYCTL0379: System boot is in process"
+        self.assertRaises(CliError, tail.poll)
+        log.failure = None
+
+        self.assertEqual(tail.poll(), ["a"])
+        self.assertFalse(tail._legacy)
+
+    def test_follow_logs_should_report_failing_instances(self):
+        controller = FakeLog(["x"])
+        controller.failure = "WFLYCTL0379: System boot is in process"
+        host = Struct(name="h1", controller=controller)
+        instance = jbosscli.Instance({"name": "s1", "group": "g1", "status": "STARTED"}, host)
+        errors = {}
+
+        follower = jbosscli.follow_logs([instance], interval=0.01, errors=errors)
+        thread = threading.Thread(target=lambda: next(follower))
+        thread.start()
+        for _ in range(500):
+            if errors:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(errors[instance].msg, "WFLYCTL0379: System boot is in process")
+        controller.failure = None
+        thread.join()
+        self.assertEqual(errors, {})
+        follower.close()
+
+    def test_follow_logs_should_yield_lines_of_all_instances(self):
+        controller = FakeLog(["x"])
+        host = Struct(name="h1", controller=controller)
+        instances = [
+            jbosscli.Instance({"name": n, "group": "g1", "status": "STARTED"}, host)
+            for n in ("s1", "s2")
+        ]
+
+        follower = jbosscli.follow_logs(instances, interval=0.01)
+        lines = [next(follower), next(follower)]
+        follower.close()
+
+        self.assertEqual(sorted((i.name, l) for i, l in lines), [("s1", "x"), ("s2", "x")])
+
+    def test_instance_follow_log_should_yield_its_lines(self):
+        host = Struct(name="h1", controller=FakeLog(["x", "y"]))
+        instance = jbosscli.Instance({"name": "s1", "group": "g1", "status": "STARTED"}, host)
+
+        follower = instance.follow_log(interval=0.01)
+        lines = [next(follower), next(follower)]
+        follower.close()
+
+        self.assertTrue(isinstance(instance.log_tail(), jbosscli.LogTail))
+        self.assertEqual(lines, ["x", "y"])
+
+class TestTopology(unittest.TestCase):
+    """
+        Tests for the topology indexes
+    """
+
+    def _cli(self):
+        with patch("jbosscli.Jbosscli._fetch_controller_data", MagicMock()):
+            cli = Jbosscli("h:p", "u:p")
+        cli.domain = True
+        cli.hosts = []
+        for host_name in ("h1", "h2"):
+            host = Struct(name=host_name, controller=cli)
+            host.instances = [
+                jbosscli.Instance({"name": "s1", "group": "g1", "status": "STARTED"}, host),
+                jbosscli.Instance({"name": "s2", "group": "g2", "status": "STOPPED"}, host)
+            ]
+            cli.hosts.append(host)
+        cli.server_groups = [
+            Struct(name="g1", profile="full"),
+            Struct(name="g2", profile="full"),
+            Struct(name="g3", profile="ha")
+        ]
+        return cli
+
+    def test_lookups(self):
+        cli = self._cli()
+
+        self.assertEqual(cli.get_host("h2").name, "h2")
+        self.assertEqual(cli.get_instance("s2", "h2").host.name, "h2")
+        self.assertEqual(cli.get_instance("s1").name, "s1")
+        self.assertEqual(cli.get_instance("nope"), None)
+        self.assertEqual(len(cli.get_instances()), 4)
+        self.assertEqual([i.host.name for i in cli.get_instances("g1")], ["h1", "h2"])
+        self.assertEqual(cli.get_instances("g2", running=True), [])
+        self.assertEqual(len(cli.get_instances(running=True)), 2)
+        self.assertEqual(cli.get_server_group("g3").profile, "ha")
+        self.assertEqual(
+            sorted(g.name for g in cli.get_server_groups("full")),
+            ["g1", "g2"]
+        )
+
+    def test_context_root_should_only_scan_running_instances_of_the_group(self):
+        cli = self._cli()
+        cli.invoke_cli = MagicMock(side_effect=[CliError("not there"), "/app"])
+        deployment = jbosscli.Deployment(
+            {"name": "app.war", "runtime-name": "app.war", "enabled": True},
+            cli.get_server_group("g1"),
+            controller=cli
+        )
+
+        self.assertEqual(deployment.get_context_root(), "/app")
+        self.assertEqual(
+            [c[0][0]["address"][:4] for c in cli.invoke_cli.call_args_list],
+            [["host", "h1", "server", "s1"], ["host", "h2", "server", "s1"]]
+        )
+
+    def test_model_load_should_build_the_index(self):
+        cli_response = {
+            "name": "a name for the server",
+            "product-name": "a product name",
+            "product-version": "1.2.3",
+            "release-codename": "Batman",
+            "release-version": "3.2.1GA",
+            "launch-type": "STANDALONE"
+        }
+
+        with patch("jbosscli.Jbosscli.invoke_cli", MagicMock(return_value=cli_response)):
+            cli = Jbosscli("h:p", "u:p")
+
+        self.assertTrue(cli._topology is not None)
+        self.assertEqual(cli.get_host("a name for the server - Standalone"), cli.hosts[0])
+
+class TestProfiler(unittest.TestCase):
+    """
+        Tests for the phase profiler
+    """
+
+    def test_nested_phases_should_accumulate(self):
+        profiler = jbosscli.Profiler()
+
+        for _ in range(2):
+            with profiler.phase("load"):
+                with profiler.phase("network"):
+                    time.sleep(0.01)
+
+        self.assertEqual(sorted(profiler.phases.keys()), ["load", "load/network"])
+        self.assertEqual(profiler.phases["load"].calls, 2)
+        self.assertTrue(profiler.phases["load/network"].wall >= 0.02)
+        self.assertTrue(profiler.phases["load"].self_wall < profiler.phases["load"].wall)
+        self.assertTrue("  network" in profiler.report())
+
+    @unittest.skipUnless(os.path.exists("/proc/self/statm"), "needs /proc")
+    def test_phase_memory_should_reflect_allocations(self):
+        profiler = jbosscli.Profiler()
+        # raises the peak resident size, the phase below stays under it
+        peak = "x" * (32 << 20)
+        del peak
+
+        with profiler.phase("allocate"):
+            data = "x" * (32 << 20)
+
+        self.assertTrue(profiler.phases["allocate"].memory >= len(data) // 2)
+
+    @patch(
+        "jbosscli.requests.post",
+        MagicMock(
+            return_value=Struct(
+                status_code=200,
+                text=None,
+                json=MagicMock(return_value={"outcome": "success", "result": {
+                    "name": "a name for the server",
+                    "product-name": "a product name",
+                    "product-version": "1.2.3",
+                    "release-codename": "Batman",
+                    "release-version": "3.2.1GA",
+                    "launch-type": "STANDALONE"
+                }})
+            )
+        )
+    )
+    def test_model_load_phases(self):
+        profiler = jbosscli.Profiler()
+
+        Jbosscli("h:p", "u:p", profiler=profiler)
+
+        self.assertEqual(sorted(profiler.phases.keys()), [
+            "refresh",
+            "refresh/fetch_controller_data",
+            "refresh/fetch_controller_data/decode",
+            "refresh/fetch_controller_data/network"
+        ])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/python
+
+import unittest
+import threading
+
+from mock import MagicMock
+
+import loadgen
+from jbosscli import CliError
+from stub import StubController
+
+class TestLoadGenerator(unittest.TestCase):
+    """
+        Tests for the load generator, against the stub controller
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = StubController()
+        thread = threading.Thread(target=cls.stub.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.shutdown()
+        cls.stub.server_close()
+
+    def test_closed_loop_should_report_every_operation_of_the_mix(self):
+        cli, targets = loadgen.connect(self.stub.controller, "a:b")
+        self.addCleanup(cli.session.close)
+        generator = loadgen.LoadGenerator(cli, loadgen.parse_mix("root,memory=2,datasources"), targets)
+
+        report = generator.run(duration=0.3, concurrency=2)
+
+        self.assertEqual(targets, [[]])
+        self.assertTrue(report.requests > 0)
+        self.assertEqual(sorted(report.stats), ["datasources", "memory", "root"])
+        for stats in report.stats.values():
+            self.assertEqual(stats.error_rate, 0.0)
+        self.assertTrue("requests/s" in report.format())
+
+    def test_rated_run_should_send_about_the_target_rate(self):
+        cli, targets = loadgen.connect(self.stub.controller, "a:b")
+        self.addCleanup(cli.session.close)
+        generator = loadgen.LoadGenerator(cli, {"root": 1}, targets)
+
+        report = generator.run(duration=0.5, rate=40, concurrency=4)
+
+        self.assertTrue(15 <= report.requests <= 25, report.requests)
+
+    def test_failures_should_be_counted_per_error_type(self):
+        cli = MagicMock()
+        cli.invoke_cli.side_effect = CliError({"outcome": "failed", "failure-description": "x"})
+        generator = loadgen.LoadGenerator(cli, {"memory": 1})
+
+        report = generator.run(duration=0.05)
+
+        stats = report.stats["memory"]
+        self.assertEqual(stats.latencies, [])
+        self.assertEqual(stats.errors, {"CliError": stats.count})
+        self.assertEqual(stats.error_rate, 1.0)
+
+    def test_parse_mix_should_reject_unknown_operations(self):
+        self.assertEqual(loadgen.parse_mix("root=3,memory"), {"root": 3.0, "memory": 1.0})
+        self.assertRaises(ValueError, loadgen.parse_mix, "reboot=1")
+
+    def test_percentile_should_use_nearest_rank(self):
+        values = range(1, 101)
+
+        self.assertEqual(loadgen.percentile(values, 0.5), 50)
+        self.assertEqual(loadgen.percentile(values, 0.99), 99)
+        self.assertEqual(loadgen.percentile(values, 1.0), 100)
+        self.assertEqual(loadgen.percentile([], 0.5), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/python
+
+import json
+import unittest
+import threading
+from mock import MagicMock
+
+import requests
+
+from jbosscli import JsonCodec
+from proxy import CachingProxy
+from proxy import ProxyServer
+
+READ_SERVER = {
+    "operation": "read-resource",
+    "address": ["host", "h1", "server-config", "s1"]
+}
+
+READ_OTHER_HOST = {
+    "operation": "read-resource",
+    "address": [{"host": "h2"}]
+}
+
+class TestCachingProxy(unittest.TestCase):
+    """
+        Tests for the caching proxy
+    """
+
+    def setUp(self):
+        self.cli = MagicMock()
+        self.cli.invoke_raw = MagicMock(
+            return_value={"outcome": "success", "result": {"status": "STARTED"}}
+        )
+        self.proxy = CachingProxy(self.cli, ttl=60)
+
+    def test_reads_should_be_cached(self):
+        first = self.proxy.handle(READ_SERVER)
+        second = self.proxy.handle(dict(READ_SERVER))
+
+        self.assertEqual(first, {"outcome": "success", "result": {"status": "STARTED"}})
+        self.assertEqual(second, first)
+        self.assertEqual(self.cli.invoke_raw.call_count, 1)
+        self.assertEqual((self.proxy.hits, self.proxy.misses), (1, 1))
+
+    def test_expired_reads_should_be_fetched_again(self):
+        self.proxy.ttl = -1
+
+        self.proxy.handle(READ_SERVER)
+        self.proxy.handle(READ_SERVER)
+
+        self.assertEqual(self.cli.invoke_raw.call_count, 2)
+
+    def test_write_should_invalidate_overlapping_reads_only(self):
+        self.proxy.handle(READ_SERVER)
+        self.proxy.handle(READ_OTHER_HOST)
+
+        self.proxy.handle({
+            "operation": "stop",
+            "address": [{"host": "h1"}, {"server-config": "*"}]
+        })
+        self.proxy.handle(READ_SERVER)
+        self.proxy.handle(READ_OTHER_HOST)
+
+        # two initial reads, the write and the invalidated read
+        self.assertEqual(self.cli.invoke_raw.call_count, 4)
+        self.assertEqual(self.proxy.writes, 1)
+
+    def test_root_write_should_invalidate_everything(self):
+        self.proxy.handle(READ_SERVER)
+        self.proxy.handle({"operation": "write-attribute", "name": "x", "value": "y"})
+        self.proxy.handle(READ_SERVER)
+
+        self.assertEqual(self.cli.invoke_raw.call_count, 3)
+
+    def test_failures_should_be_returned_and_not_cached(self):
+        failure = {"outcome": "failed", "failure-description": "nope"}
+        self.cli.invoke_raw = MagicMock(return_value=failure)
+
+        self.assertEqual(self.proxy.handle(READ_SERVER), failure)
+        self.proxy.handle(READ_SERVER)
+
+        self.assertEqual(self.cli.invoke_raw.call_count, 2)
+
+    def test_writes_should_return_the_full_controller_response(self):
+        response = {
+            "outcome": "success",
+            "result": None,
+            "response-headers": {
+                "operation-requires-reload": True,
+                "process-state": "reload-required"
+            }
+        }
+        self.cli.invoke_raw = MagicMock(return_value=response)
+
+        self.assertEqual(
+            self.proxy.handle({"operation": "write-attribute", "name": "x", "value": "y"}),
+            response
+        )
+
+    def test_reads_in_flight_during_a_write_should_not_be_cached(self):
+        stale = {"outcome": "success", "result": {"status": "STARTED"}}
+        fresh = {"outcome": "success", "result": {"status": "STOPPED"}}
+
+        def invoke_raw(command):
+            if command["operation"] == "read-resource" and self.cli.invoke_raw.call_count == 1:
+                # the write lands while the first read is on the wire
+                self.proxy.handle({"operation": "stop", "address": ["host", "h1"]})
+                return stale
+            return fresh if command["operation"] == "read-resource" else stale
+
+        self.cli.invoke_raw = MagicMock(side_effect=invoke_raw)
+
+        self.assertEqual(self.proxy.handle(READ_SERVER), stale)
+        self.assertEqual(self.proxy.handle(READ_SERVER), fresh)
+        self.assertEqual(self.proxy.handle(READ_SERVER), fresh)
+        # first read, the write, then one read cached for the third call
+        self.assertEqual(self.cli.invoke_raw.call_count, 3)
+
+class TestProxyServer(unittest.TestCase):
+    """
+        Tests for the proxy HTTP endpoint
+    """
+
+    def setUp(self):
+        cli = MagicMock()
+        cli.codec = JsonCodec()
+        cli.invoke_raw = MagicMock(return_value={"outcome": "success", "result": 1})
+        self.server = ProxyServer(("127.0.0.1", 0), CachingProxy(cli))
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = "http://{0}:{1}/management".format(*self.server.server_address)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_non_object_bodies_should_be_rejected(self):
+        for body in ["[1, 2]", '{"operation": "composite", "steps": [1]}', "not json"]:
+            response = requests.post(self.url, data=body)
+
+            self.assertEqual(response.status_code, 400, body)
+            self.assertEqual(response.json()["outcome"], "failed")
+
+    def test_operations_should_be_answered(self):
+        response = requests.post(self.url, data=json.dumps({"operation": "read-resource"}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"outcome": "success", "result": 1})
+
+    def test_writes_should_be_refused_unless_allowed(self):
+        shutdown = json.dumps({"operation": "shutdown"})
+
+        refused = requests.post(self.url, data=shutdown)
+        self.server.proxy.allow_writes = True
+        allowed = requests.post(self.url, data=shutdown)
+
+        self.assertEqual(refused.status_code, 403)
+        self.assertEqual(allowed.status_code, 200)
+        self.assertEqual(self.server.proxy.cli.invoke_raw.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from mock import MagicMock
+
+from jbosscli import Jbosscli
+from jbosscli import ServerError
+from replay import RecordingSession
+from replay import ReplaySession
+from replay import ReplayResponse
+
+STANDALONE = {
+    "outcome": "success",
+    "result": {
+        "name": "a name for the server",
+        "product-name": "a product name",
+        "product-version": "1.2.3",
+        "release-codename": "Batman",
+        "release-version": "3.2.1GA",
+        "launch-type": "STANDALONE"
+    }
+}
+
+class TestRecordReplay(unittest.TestCase):
+    """
+        Tests for recording and replaying management traffic
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "standalone.rec")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _record(self, responses):
+        session = MagicMock()
+        session.post = MagicMock(side_effect=[
+            ReplayResponse(200, json.dumps(r)) for r in responses
+        ])
+        return RecordingSession(self.path, session)
+
+    def test_recorded_model_should_load_from_replay(self):
+        with self._record([STANDALONE]) as recording:
+            recorded = Jbosscli("h:p", "user:secret", session=recording)
+
+        replayed = Jbosscli("h:p", "other:auth", session=ReplaySession(self.path, 0))
+
+        self.assertEqual(replayed.name, recorded.name)
+        self.assertEqual(replayed.hosts[0].name, "a name for the server - Standalone")
+
+    def test_recording_should_redact_secrets(self):
+        response = {"outcome": "success", "result": {"user-name": "sa", "password": "pw"}}
+        with self._record([STANDALONE, response]) as recording:
+            cli = Jbosscli("h:p", "user:secret", session=recording)
+            cli.invoke_cli({"operation": "add", "password": "pw", "address": []})
+
+        with open(self.path, "rb") as raw:
+            self.assertEqual(raw.read(2), "\x1f\x8b")
+
+        replay = ReplaySession(self.path, 0)
+        resp = replay.post("http://h:p/management", data=json.dumps(
+            {"operation": "add", "password": "other", "address": []}
+        ))
+        self.assertEqual(resp.json()["result"], {"user-name": "sa", "password": "***"})
+
+    def test_repeated_requests_should_replay_in_order(self):
+        first = {"outcome": "success", "result": 1}
+        second = {"outcome": "success", "result": 2}
+        with self._record([STANDALONE, first, second]) as recording:
+            cli = Jbosscli("h:p", "u:p", session=recording)
+            cli.invoke_cli({"operation": "read-attribute", "name": "x"})
+            cli.invoke_cli({"operation": "read-attribute", "name": "x"})
+
+        cli = Jbosscli("h:p", "u:p", session=ReplaySession(self.path, 0))
+        results = [cli.invoke_cli({"operation": "read-attribute", "name": "x"}) for _ in range(3)]
+
+        self.assertEqual(results, [1, 2, 1])
+
+    def test_controllers_should_replay_their_own_responses(self):
+        other = dict(STANDALONE, result=dict(STANDALONE["result"], name="other server"))
+        with self._record([STANDALONE, other]) as recording:
+            Jbosscli("a:9990", "u:p", session=recording)
+            Jbosscli("b:9990", "u:p", session=recording)
+
+        replay = ReplaySession(self.path, 0)
+        names = [Jbosscli(c, "u:p", session=replay).name for c in ("b:9990", "a:9990", "b:9990")]
+
+        self.assertEqual(names, ["other server", "a name for the server", "other server"])
+        with self.assertRaises(ServerError):
+            Jbosscli("c:9990", "u:p", session=replay)
+
+    def test_any_controller_should_fan_out_one_recording(self):
+        with self._record([STANDALONE]) as recording:
+            Jbosscli("a:9990", "u:p", session=recording)
+
+        replay = ReplaySession(self.path, 0, any_controller=True)
+
+        self.assertEqual(Jbosscli("c:9990", "u:p", session=replay).name, "a name for the server")
+
+    def test_unrecorded_request_should_raise_ServerError(self):
+        with self._record([STANDALONE]) as recording:
+            Jbosscli("h:p", "u:p", session=recording)
+
+        cli = Jbosscli("h:p", "u:p", session=ReplaySession(self.path, 0))
+
+        with self.assertRaises(ServerError):
+            cli.invoke_cli({"operation": "reload"})
+
+if __name__ == '__main__':
+    unittest.main()
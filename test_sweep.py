@@ -0,0 +1,51 @@
+#!/usr/bin/python
+
+import time
+import unittest
+
+import sweep
+
+class FakeCli(object):
+    def __init__(self, controller, auth):
+        if controller == "broken":
+            raise ValueError("unreachable")
+        self.name = controller
+        self.product_version = "1.2.3"
+        self.hosts = []
+        self.deployments = []
+
+class SlowCli(FakeCli):
+    def __init__(self, controller, auth):
+        time.sleep(0.2)
+        FakeCli.__init__(self, controller, auth)
+
+class TestSweep(unittest.TestCase):
+    """
+        Tests for process pool sweeps
+    """
+
+    def test_sweep_should_merge_results_and_errors_from_workers(self):
+        results, errors = sweep.sweep(
+            [("c1", "u:p"), ("c2", "u:p"), ("broken", "u:p")],
+            processes=2,
+            cli_factory=FakeCli
+        )
+
+        self.assertEqual(sorted(results.keys()), ["c1", "c2"])
+        self.assertEqual(results["c1"]["name"], "c1")
+        self.assertEqual(results["c1"]["server-groups"], [])
+        self.assertEqual(errors, {"broken": "ValueError: unreachable"})
+
+    def test_each_process_should_sweep_its_shard_concurrently(self):
+        fleet = [("c{0}".format(i), "u:p") for i in range(20)]
+
+        start = time.time()
+        results, errors = sweep.sweep(fleet, processes=1, cli_factory=SlowCli, threads=20)
+
+        self.assertEqual(len(results), 20)
+        self.assertEqual(errors, {})
+        # sequential connections would take 4 s
+        self.assertTrue(time.time() - start < 2)
+
+if __name__ == '__main__':
+    unittest.main()